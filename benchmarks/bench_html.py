@@ -0,0 +1,87 @@
+"""Time index.html generation for large synthetic galleries.
+
+Compares streaming the page to disk (what generate_html does) with building
+the whole page as one string, and reports the peak Python heap of each.
+
+    python benchmarks/bench_html.py [--sizes 1000 10000 100000]
+"""
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery import ImageGallery, asset_name  # noqa: E402
+
+# Stand-in for make_placeholder's output: an average colour and a ~300 byte data URI
+PLACEHOLDER = {'color': '#7f8a91', 'data_uri': 'data:image/webp;base64,' + 'A' * 300}
+
+
+def synthetic_gallery(count, output_dir):
+    gallery = ImageGallery(output_dir, output_dir)
+    gallery.images = [
+        {
+            'filename': f"photo-{i:06d}.jpg",
+            'thumbnail': asset_name(f"{i:064x}", (400, 266), '.jpg', 85),
+            'renditions': [
+                {'file': asset_name(f"{i:064x}", (size, size * 2 // 3), '.jpg', 85),
+                 'width': size, 'height': size * 2 // 3,
+                 'formats': {fmt: asset_name(f"{i:064x}", (size, size * 2 // 3), f".{fmt}", 80)
+                             for fmt in gallery.formats}}
+                for size in gallery.renditions
+            ],
+            'width': 6000,
+            'height': 4000 if i % 5 else 2000,
+            'aspect_ratio': 1.5 if i % 5 else 3.0,
+            'placeholder': PLACEHOLDER,
+            'needs_assets': False,
+        }
+        for i in range(count)
+    ]
+    gallery.likes = {img['filename']: i % 7 for i, img in enumerate(gallery.images)}
+    return gallery
+
+
+def measure(func):
+    """Time one untraced run, then take the heap peak from a traced one."""
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print(f"{'images':>8} {'mode':<10} {'time (s)':>9} {'peak heap (MiB)':>16} {'page (MiB)':>11}")
+    for count in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            gallery = synthetic_gallery(count, tmp_dir)
+            index_path = Path(tmp_dir) / 'index.html'
+
+            def streamed():
+                with open(index_path, 'w', encoding='utf-8') as f:
+                    f.writelines(gallery.render_html())
+
+            def buffered():
+                html = ''.join(gallery.render_html())
+                with open(index_path, 'w', encoding='utf-8') as f:
+                    f.write(html)
+
+            for mode, func in (('streamed', streamed), ('buffered', buffered)):
+                elapsed, peak = measure(func)
+                size = index_path.stat().st_size / (1024 * 1024)
+                print(f"{count:>8} {mode:<10} {elapsed:>9.2f} {peak:>16.1f} {size:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Compare the sequential thumbnailer with staged thread pipelines.
+
+Each configuration builds the thumbnails of ``--images`` into a fresh
+directory; pipelines also print their per-stage counters, which show
+whether the host is disk-bound (readers/writers busy) or CPU-bound
+(encoders busy).
+
+    python benchmarks/bench_pipeline.py [--images ./images] [--pipelines 1,1,1 2,0,2 4,0,4]
+
+A pipeline is READERS,ENCODERS,WRITERS; 0 encoders means one per CPU.
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery import ImageGallery  # noqa: E402
+
+
+def build(images_dir, pipeline_threads):
+    with tempfile.TemporaryDirectory() as out_dir:
+        gallery = ImageGallery(images_dir, out_dir, pipeline_threads=pipeline_threads)
+        start = time.perf_counter()
+        gallery.process_images()
+        elapsed = time.perf_counter() - start
+    return elapsed, len(gallery.images), gallery.pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', default='./images')
+    parser.add_argument('--pipelines', nargs='+', default=['1,1,1', '2,0,2', '4,0,4'])
+    args = parser.parse_args()
+
+    configs = [None] + [tuple(int(n) for n in spec.split(',')) for spec in args.pipelines]
+    results = []
+    for config in configs:
+        elapsed, count, pipeline = build(args.images, config)
+        results.append((config, elapsed, count, pipeline))
+
+    print(f"\n{'mode':<18} {'images':>7} {'wall (s)':>9} {'images/s':>9}")
+    for config, elapsed, count, pipeline in results:
+        name = 'sequential' if config is None else 'pipeline ' + ','.join(map(str, config))
+        print(f"{name:<18} {count:>7} {elapsed:>9.2f} {count / elapsed:>9.1f}")
+        if pipeline is not None:
+            for line in pipeline.summary():
+                print(f"    {line}")
+
+
+if __name__ == '__main__':
+    main()
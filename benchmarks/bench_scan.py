@@ -0,0 +1,96 @@
+"""Time scanning a large nested tree of images, separately from processing it.
+
+Builds a synthetic tree (``--files`` tiny, distinct JPEGs spread over
+``--dirs`` subdirectories, plus a sidecar .txt per ten images that the scan
+has to skip), then reports:
+
+  * the previous flat approach generalised to a tree (Path.rglob, a suffix
+    check and a Path.stat per file),
+  * gallery_scanner.scan_images on its own,
+  * a metadata-only build (headers only, see gallery.read_metadata),
+  * a full recursive ImageGallery.process_images, whose scan overlaps decoding,
+    so its total is compared with the scan alone.
+
+    python benchmarks/bench_scan.py [--files 200000] [--dirs 400] [--workers 4]
+
+Pass --no-process to time only the scans; processing 200k images takes a while.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery import IMAGE_EXTENSIONS, ImageGallery  # noqa: E402
+from gallery_scanner import scan_images  # noqa: E402
+
+
+def build_tree(root, files, dirs):
+    """Write ``files`` 8x8 JPEGs, each a different colour, over ``dirs`` directories two levels deep."""
+    for i in range(files):
+        directory = root / f"{(i % dirs) // 20:03d}" / f"{i % dirs:04d}"
+        if i < dirs:
+            directory.mkdir(parents=True, exist_ok=True)
+        color = (i % 256, (i // 256) % 256, (i // 65536) % 256)
+        Image.new('RGB', (8, 8), color).save(directory / f"img-{i:06d}.jpg", quality=50)
+        if i % 10 == 0:
+            (directory / f"img-{i:06d}.txt").write_text('caption')
+
+
+def rglob_scan(root):
+    return [(p, p.stat()) for p in root.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200000)
+    parser.add_argument('--dirs', type=int, default=400)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--no-process', action='store_true', help='Only time the scans')
+    parser.add_argument('--tmp-dir', default=None, help='Where to build the tree (default: system temp)')
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix='bench_scan_', dir=args.tmp_dir))
+    try:
+        source = root / 'images'
+        print(f"Building {args.files} images in {args.dirs} directories under {root} ...")
+        elapsed, _ = timed(build_tree, source, args.files, args.dirs)
+        print(f"  built in {elapsed:.1f}s")
+
+        elapsed, found = timed(rglob_scan, source)
+        print(f"{'rglob + Path.stat':<28} {elapsed:>8.2f}s {len(found):>8} images")
+        elapsed, found = timed(lambda: list(scan_images(source, IMAGE_EXTENSIONS, recursive=True)))
+        scan_time = elapsed
+        print(f"{'scan_images':<28} {elapsed:>8.2f}s {len(found):>8} images")
+        if args.no_process:
+            return
+
+        gallery = ImageGallery(source, root / 'metadata', recursive=True, metadata_only=True)
+        elapsed, _ = timed(gallery.process_images)
+        print(f"{'process_images (metadata)':<28} {elapsed:>8.2f}s {len(gallery.images):>8} images")
+
+        gallery = ImageGallery(source, root / 'output', workers=args.workers, recursive=True)
+        elapsed, _ = timed(gallery.process_images)
+        print(f"{'process_images (fresh)':<28} {elapsed:>8.2f}s {len(gallery.images):>8} images "
+              f"({args.workers} workers, {len(gallery.images) / elapsed:.0f} images/s; "
+              f"scan alone is {scan_time / elapsed:.1%} of that)")
+        elapsed, _ = timed(gallery.process_images)
+        print(f"{'process_images (unchanged)':<28} {elapsed:>8.2f}s {len(gallery.images):>8} images")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
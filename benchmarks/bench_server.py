@@ -0,0 +1,138 @@
+"""Measure GalleryServer requests/sec for /, a thumbnail and /likes.
+
+Starts gallery_server.py in a subprocess for each serving mode, drives it
+with keep-alive client threads at several concurrency levels, then sends a
+burst of concurrent likes and checks none were lost once the server has
+shut down and flushed.
+
+    python benchmarks/bench_server.py --dir ./gallery_output [--modes 1x1 1x8 4x1 4x8]
+
+Modes are WORKERSxTHREADS; 1x1 is Flask's development server.
+"""
+import argparse
+import http.client
+import json
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def hammer(port, method, path, concurrency, duration):
+    """Send requests from ``concurrency`` keep-alive clients for ``duration`` seconds."""
+    deadline = time.time() + duration
+    counts = []
+
+    def client():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        done = 0
+        while time.time() < deadline:
+            conn.request(method, path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                raise RuntimeError(f"{method} {path} -> {response.status}")
+            done += 1
+        conn.close()
+        counts.append(done)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.time() - start)
+
+
+def like_count(db_path, filename):
+    with sqlite3.connect(db_path) as conn:
+        row = conn.execute('SELECT count FROM likes WHERE filename = ?', (filename,)).fetchone()
+    return row[0] if row else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dir', default='./gallery_output')
+    parser.add_argument('--modes', nargs='+', default=['1x1', '1x8', '4x1', '4x8'])
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per measurement')
+    parser.add_argument('--likes', type=int, default=2000, help='likes sent in the lost-update check')
+    args = parser.parse_args()
+
+    gallery_dir = Path(args.dir).resolve()
+    manifest = json.loads((gallery_dir / 'manifest.json').read_text())
+    entry = next(iter(manifest['entries'].values()))
+    paths = {
+        '/': '/',
+        '/thumbnails/*': '/thumbnails/' + quote(entry['thumbnail']),
+        '/likes': '/likes',
+    }
+
+    print(f"{'mode':<6} {'endpoint':<14} " + ' '.join(f"{f'c={c}':>9}" for c in args.concurrency))
+    for mode in args.modes:
+        workers, threads = (int(n) for n in mode.split('x'))
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, str(ROOT / 'gallery_server.py'), '--dir', str(gallery_dir), '--port', str(port),
+             '--host', '127.0.0.1', '--workers', str(workers), '--threads', str(threads), '--no-browser'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            wait_until_up(port)
+            rows = []
+            for name, path in paths.items():
+                rates = [hammer(port, 'GET', path, c, args.duration) for c in args.concurrency]
+                rows.append(f"{mode:<6} {name:<14} " + ' '.join(f"{rate:>9.0f}" for rate in rates))
+
+            # Concurrent likes spread over every worker must all reach the store
+            before = like_count(gallery_dir / 'likes.db', entry['filename'])
+            like_path = f"/likes/{quote(entry['filename'])}/increment"
+            conn_count = max(args.concurrency)
+            with ThreadPoolExecutor(conn_count) as executor:
+                def send_likes(n):
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    for _ in range(n):
+                        conn.request('POST', like_path)
+                        conn.getresponse().read()
+                    conn.close()
+                list(executor.map(send_likes, [args.likes // conn_count] * conn_count))
+            sent = args.likes // conn_count * conn_count
+        finally:
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=60)
+
+        stored = like_count(gallery_dir / 'likes.db', entry['filename']) - before
+        check = 'OK' if stored == sent else f"LOST {sent - stored} of {sent}"
+        for row in rows:
+            print(row)
+        print(f"{mode:<6} {'likes':<14} {sent} concurrent likes -> {stored} stored: {check}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Time page flips of the generated gallery script against galleries of growing size.
+
+Runs the page's own <script> under Node with a minimal stand-in DOM (a
+``.gallery`` container whose children are searched linearly, like a real
+document), flips through random pages and reports the mean cost of
+renderPage next to the previous implementation, which touched every item.
+
+    python benchmarks/bench_showpage.py [--sizes 1000 10000 100000] [--flips 200]
+
+Needs ``node`` on the PATH.
+"""
+import argparse
+import json
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bench_html import synthetic_gallery  # noqa: E402
+
+HARNESS = r"""
+class ClassList {
+    constructor() { this.names = new Set(); }
+    add(name) { this.names.add(name); }
+    remove(name) { this.names.delete(name); }
+    contains(name) { return this.names.has(name); }
+}
+class Element {
+    constructor(dataset = {}) {
+        this.dataset = dataset;
+        this.classList = new ClassList();
+        this.children = [];
+        this.style = {};
+        this.textContent = '';
+        this.parts = {};
+    }
+    querySelector(selector) { return this.parts[selector] || (this.parts[selector] = new Element()); }
+    querySelectorAll() { return []; }
+    addEventListener() {}
+    scrollIntoView() {}
+}
+
+const COUNT = %(count)d;
+const gallery = new Element();
+for (let i = 0; i < COUNT; i++) {
+    gallery.children.push(new Element({index: String(i), filename: `photo-${i}.jpg`}));
+}
+const elementsById = {};
+const document = {
+    querySelector(selector) {
+        if (selector === '.gallery') return gallery;
+        const match = /data-index="(\d+)"/.exec(selector);
+        // A real document walks the tree; so does this one
+        return gallery.children.find(item => item.dataset.index === match[1]) || null;
+    },
+    querySelectorAll(selector) {
+        return selector === '.gallery-item' ? gallery.children : [];
+    },
+    getElementById(id) { return elementsById[id] || (elementsById[id] = new Element()); },
+    addEventListener(type, listener) { if (type === 'DOMContentLoaded') this.ready = listener; },
+};
+const fetch = () => Promise.resolve({ok: true, json: () => ({})});
+const location = {hash: ''};
+const history = {replaceState() {}};
+const images = Array.from({length: COUNT}, (_, i) => ({filename: `photo-${i}.jpg`}));
+
+%(script)s
+
+// The implementation before item caching, for comparison
+function legacyRenderPage(page) {
+    const start = (page - 1) * imagesPerPage;
+    const end = start + imagesPerPage;
+    document.querySelectorAll('.gallery-item').forEach(item => {
+        item.classList.remove('visible');
+    });
+    for (let i = start; i < end && i < images.length; i++) {
+        const galleryItem = document.querySelector(`[data-index="${i}"]`);
+        galleryItem.classList.add('visible');
+        galleryItem.querySelector('.like-button').classList.add('liked');
+    }
+}
+
+document.ready();
+const pages = Array.from({length: %(flips)d}, () => 1 + Math.floor(Math.random() * totalPages));
+const results = {};
+for (const [name, render] of [['cached', renderPage], ['legacy', legacyRenderPage]]) {
+    const start = performance.now();
+    pages.forEach(page => render(page));
+    results[name] = (performance.now() - start) / pages.length;
+}
+console.log(JSON.stringify(results));
+"""
+
+
+def page_script(images_per_page):
+    """The main <script> of a generated index.html."""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gallery = synthetic_gallery(1, tmp_dir)
+        gallery.images_per_page = images_per_page
+        html = ''.join(gallery.render_html())
+    return re.findall(r'<script>(.*?)</script>', html, re.S)[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--flips', type=int, default=200)
+    parser.add_argument('--per-page', type=int, default=12)
+    args = parser.parse_args()
+
+    script = page_script(args.per_page)
+    print(f"{'images':>8} {'renderPage (ms)':>16} {'previous (ms)':>14}")
+    for count in args.sizes:
+        with tempfile.NamedTemporaryFile('w', suffix='.js') as harness:
+            harness.write(HARNESS % {'count': count, 'flips': args.flips, 'script': script})
+            harness.flush()
+            output = subprocess.run(['node', harness.name], check=True, capture_output=True, text=True).stdout
+        result = json.loads(output)
+        print(f"{count:>8} {result['cached']:>16.3f} {result['legacy']:>14.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare the old full-decode thumbnailer with the draft-mode one.
+
+``draft`` is what a build does: process_image with a single-size ladder
+(draft once, resize, plus the hash and placeholder every build makes).
+``thumb-cache`` is make_thumbnail alone, the path GalleryServer's /thumb
+route renders with. Each mode runs in a fresh interpreter so its peak RSS is measured in isolation.
+
+    python benchmarks/bench_thumbnails.py [--images ./images] [--size 400]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image  # noqa: E402
+
+from gallery import IMAGE_EXTENSIONS, make_thumbnail, process_image, thumbnail_dimensions  # noqa: E402
+
+
+def resize_and_save(resize):
+    """A mode that opens the image, resizes it with ``resize`` and saves a JPEG."""
+    def run(path, out_dir, size):
+        with Image.open(path) as img:
+            thumb_width, thumb_height = thumbnail_dimensions(img.width, img.height, (size, size))
+            thumb = resize(img, thumb_width, thumb_height)
+            thumb.save(Path(out_dir) / path.name, 'JPEG', quality=95)
+    return run
+
+
+def full_decode(img, thumb_width, thumb_height):
+    """The previous pipeline: full-resolution copy, then resize."""
+    thumb = img.copy()
+    thumb.thumbnail((thumb_width, thumb_height), Image.Resampling.LANCZOS)
+    return thumb
+
+
+def build(path, out_dir, size):
+    # Same JPEG quality as the other modes, so only the decoding differs
+    process_image(path, Path(out_dir), (size, size), renditions=(), formats=(), quality={'jpeg': 95})
+
+
+MODES = {
+    'full-decode': resize_and_save(full_decode),
+    'draft': build,
+    'thumb-cache': resize_and_save(make_thumbnail),
+}
+
+
+def run_mode(mode, images_dir, size):
+    thumbnail = MODES[mode]
+    paths = sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        for path in paths:
+            thumbnail(path, out_dir, size)
+        elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux
+    peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'mode': mode, 'images': len(paths), 'seconds': elapsed, 'peak_rss_mib': peak_mib}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', default='./images')
+    parser.add_argument('--size', type=int, default=400)
+    parser.add_argument('--mode', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.images, args.size)
+        return
+
+    print(f"{'mode':<12} {'images':>7} {'wall (s)':>9} {'peak RSS (MiB)':>15}")
+    for mode in MODES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--images', args.images, '--size', str(args.size)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output)
+        print(f"{mode:<12} {result['images']:>7} {result['seconds']:>9.2f} {result['peak_rss_mib']:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
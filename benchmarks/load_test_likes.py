@@ -0,0 +1,72 @@
+"""Fire thousands of concurrent likes at a LikesStore and check no update is lost.
+
+Likes come from several processes with several threads each, all hitting the
+same few images so writers contend on the same rows. Exits non-zero if any
+final count is off.
+
+    python benchmarks/load_test_likes.py [--processes 8] [--threads 8] [--likes 100]
+"""
+import argparse
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gallery_likes import LikesStore  # noqa: E402
+
+FILENAMES = [f"image-{i}.jpg" for i in range(5)]
+
+
+def like_worker(args):
+    """Run ``threads`` threads that each like every image ``likes`` times."""
+    db_path, threads, likes = args
+    store = LikesStore(db_path)
+
+    def run():
+        for i in range(likes):
+            store.increment(FILENAMES[i % len(FILENAMES)])
+
+    pool = [threading.Thread(target=run) for _ in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--likes', type=int, default=100, help='likes per thread')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / 'likes.db'
+        LikesStore(db_path)
+
+        total = args.processes * args.threads * args.likes
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=args.processes) as executor:
+            list(executor.map(like_worker, [(db_path, args.threads, args.likes)] * args.processes))
+        elapsed = time.perf_counter() - start
+
+        counts = LikesStore(db_path).get_all()
+
+    expected = {name: 0 for name in FILENAMES}
+    for i in range(args.likes):
+        expected[FILENAMES[i % len(FILENAMES)]] += args.processes * args.threads
+
+    print(f"{total} likes from {args.processes} processes x {args.threads} threads "
+          f"in {elapsed:.2f}s ({total / elapsed:.0f} likes/s)")
+    if counts != expected:
+        print(f"FAILED: expected {expected}, got {counts}")
+        sys.exit(1)
+    print("OK: all counts exact")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,81 +1,709 @@
-from PIL import Image
+from PIL import Image, ExifTags
 import os
 import math
+import base64
+import argparse
+import threading
+from io import BytesIO
+from datetime import datetime
 from pathlib import Path
-import shutil
 import json
+from urllib.parse import quote
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from gallery_manifest import GalleryManifest, derived_files, file_digest
+from gallery_likes import LikesStore
+from gallery_layout import justified_layouts
+from gallery_originals import ORIGINALS_MODES, place_original
+from gallery_scanner import prefetch, relative_name, scan_images
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif')
+
+# Rendered width of grid items (see the .gallery CSS): one column on phones,
+# at most ~480px per column (two for .wide items) on larger screens
+GRID_SIZES = '(max-width: 768px) 100vw, 480px'
+GRID_SIZES_WIDE = '(max-width: 768px) 100vw, 960px'
+
+# Items wider than this span two grid columns
+WIDE_ASPECT_RATIO = 1.7
+
+# 'grid' paginates with Previous/Next; 'virtual' scrolls through every image,
+# keeping only the rows near the viewport in the DOM; 'justified' scrolls the
+# same way through rows of uncropped images laid out at build time
+LAYOUTS = ('grid', 'virtual', 'justified')
+
+# Optional formats written next to the source-format thumbnails, in order of preference
+MODERN_FORMATS = ('avif', 'webp')
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+# Encoder quality per format; previews don't need the 95 that originals might
+THUMBNAIL_QUALITY = {'jpeg': 85, 'webp': 80, 'avif': 60}
+
+# Longest side of the inline low-quality preview shown while a thumbnail loads;
+# the browser's upscaling blurs it, and it stays around 200 bytes of base64
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+
+
+def thumbnail_dimensions(width, height, thumb_size):
+    """Fit the longer side of a width x height image to the thumbnail box."""
+    aspect_ratio = width / height
+    if aspect_ratio > 1:
+        thumb_width = thumb_size[0]
+        thumb_height = int(thumb_width / aspect_ratio)
+    else:
+        thumb_height = thumb_size[1]
+        thumb_width = int(thumb_height * aspect_ratio)
+    return thumb_width, thumb_height
+
+
+def make_thumbnail(img, thumb_width, thumb_height):
+    """Resize a freshly opened (not yet loaded) image in place."""
+    # Ask the JPEG decoder for a DCT-scaled decode (1/2, 1/4 or 1/8) that still
+    # leaves 2x headroom over the target, so LANCZOS keeps its quality but the
+    # full-resolution pixels are never materialized. A no-op for other formats.
+    img.draft(img.mode, (thumb_width * 2, thumb_height * 2))
+    img.thumbnail((thumb_width, thumb_height), Image.Resampling.LANCZOS)
+    return img
+
+
+def supported_formats(formats):
+    """Keep the modern formats this Pillow build can encode, best first."""
+    Image.init()
+    return [fmt for fmt in MODERN_FORMATS if fmt in formats and fmt.upper() in Image.SAVE]
+
+
+def asset_name(digest, dims, ext, quality=None):
+    """Content-addressed name of a derived file, e.g. ``3f9a..._400x267_q80.webp``.
+
+    Everything that changes the file's bytes is in the name (source hash, size,
+    encoder quality), so a name never points at different content and can be
+    cached forever; identical sources share their files.
+    """
+    quality_part = f"_q{quality}" if quality is not None else ''
+    return f"{digest[:20]}_{dims[0]}x{dims[1]}{quality_part}{ext}"
+
+
+def make_placeholder(img):
+    """Average colour and a tiny data URI preview of an (already small) image."""
+    small = img.convert('RGB')
+    small.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), Image.Resampling.BOX)
+    color = small.resize((1, 1), Image.Resampling.BOX).getpixel((0, 0))
+    fmt = 'webp' if supported_formats(('webp',)) else 'jpeg'
+    buffer = BytesIO()
+    small.save(buffer, fmt.upper(), quality=PLACEHOLDER_QUALITY)
+    return {
+        'color': '#%02x%02x%02x' % color,
+        'data_uri': f"data:image/{fmt};base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}",
+    }
+
+
+def header_metadata(img):
+    """EXIF orientation and capture date of an opened image, read from its header.
+
+    Nothing is decoded: the EXIF block sits in the header of JPEGs (and TIFFs).
+    PNGs may keep it behind the pixel data, where Pillow would have to decode
+    to reach it, so a PNG only contributes what it declared up front.
+    Returns ``(orientation, taken)``, the date as an ISO 8601 string or None.
+    """
+    if img.format == 'PNG' and 'exif' not in img.info:
+        return 1, None
+    exif = img.getexif()
+    orientation = exif.get(ExifTags.Base.Orientation, 1)
+    taken = exif.get_ifd(ExifTags.IFD.Exif).get(ExifTags.Base.DateTimeOriginal) or exif.get(ExifTags.Base.DateTime)
+    try:
+        taken = datetime.strptime(str(taken).strip('\x00 '), '%Y:%m:%d %H:%M:%S').isoformat()
+    except ValueError:
+        # Missing, or one of the many malformed dates cameras write
+        taken = None
+    return orientation, taken
+
+
+def read_metadata(img_path):
+    """Manifest entry for an image from its header alone, with no derived files yet.
+
+    Only ``Image.open`` runs, which parses the header without decoding, so
+    indexing and laying out a collection costs a small read per file. The
+    entry is marked ``needs_assets`` for a later full build (see process_image).
+    The content hash is left out too, since it would mean reading the whole file.
+    """
+    with Image.open(img_path) as img:
+        width, height = img.size
+        orientation, taken = header_metadata(img)
+    return {
+        'filename': img_path.name,
+        'thumbnail': None,
+        'renditions': [],
+        'width': width,
+        'height': height,
+        'aspect_ratio': width / height,
+        'orientation': orientation,
+        'taken': taken,
+        'placeholder': None,
+        'sha256': None,
+        'needs_assets': True,
+    }
+
+
+def encode_thumbnail(thumb, file, suffix, fmt=None, quality=None):
+    """Write a thumbnail to ``file`` (a path or file object) in the format of ``suffix``, or in ``fmt``."""
+    quality = {**THUMBNAIL_QUALITY, **(quality or {})}
+    if fmt is not None:
+        # WebP/AVIF only take RGB(A); palette, CMYK and grayscale sources are converted
+        if thumb.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in thumb.mode or 'transparency' in thumb.info
+            thumb = thumb.convert('RGBA' if has_alpha else 'RGB')
+        thumb.save(file, fmt.upper(), quality=quality[fmt])
+    elif suffix.lower() in ('.jpg', '.jpeg'):
+        thumb.save(file, 'JPEG', quality=quality['jpeg'])
+    else:
+        thumb.save(file, Image.registered_extensions()[suffix.lower()])
+
+
+def save_thumbnail(thumb, thumb_path, fmt=None, quality=None):
+    """Save a thumbnail in the source format, or in a modern ``fmt`` such as 'webp'."""
+    # Written under a temporary name first: workers rendering duplicate sources
+    # write the same file, and readers must never see a partial one
+    tmp_path = thumb_path.with_name(f"{thumb_path.name}.{os.getpid()}.tmp")
+    encode_thumbnail(thumb, tmp_path, thumb_path.suffix, fmt, quality)
+    os.replace(tmp_path, thumb_path)
+
+
+def process_image(img_path, thumbs_dir, thumb_size, renditions=(), formats=(), quality=None,
+                  source=None, digest=None, save=save_thumbnail):
+    """Create the thumbnail and responsive renditions for a single image and return its metadata.
+
+    ``renditions`` are longest-side sizes in pixels; sizes that would upscale
+    the original are skipped, since the original itself is the largest candidate.
+    Each size is also written in every format of ``formats`` (e.g. 'webp').
+    Files are named by content (see asset_name), so if they all exist already,
+    e.g. for a duplicate of another source, nothing is decoded.
+    The placeholder (see make_placeholder) comes from the smallest rendition.
+
+    A caller that already read the file can pass its bytes as ``source`` (a
+    file object) with their ``digest``, and ``save(thumb, path, fmt, quality)``
+    replaces save_thumbnail, e.g. to hand the writes to other threads
+    (see gallery_pipeline).
+    """
+    digest = digest or file_digest(img_path)
+    quality = {**THUMBNAIL_QUALITY, **(quality or {})}
+    ext = img_path.suffix.lower()
+    ext_quality = quality['jpeg'] if ext in ('.jpg', '.jpeg') else None
+    with Image.open(source or img_path) as img:
+        # Get original dimensions (before draft() shrinks img.size)
+        orig_width, orig_height = img.size
+        orientation, taken = header_metadata(img)
+        aspect_ratio = orig_width / orig_height
+        
+        # Grid thumbnail first, then every ladder size it doesn't already cover
+        thumb_dims = thumbnail_dimensions(orig_width, orig_height, thumb_size)
+        if thumb_dims[0] > orig_width:
+            thumb_dims = (orig_width, orig_height)
+        targets = [thumb_dims]
+        for size in renditions:
+            dims = thumbnail_dimensions(orig_width, orig_height, (size, size))
+            if dims[0] < orig_width and dims not in targets:
+                targets.append(dims)
+        
+        variants = []
+        for dims in sorted(targets):
+            variants.append({
+                'file': asset_name(digest, dims, ext, ext_quality),
+                'width': dims[0],
+                'height': dims[1],
+                'formats': {fmt: asset_name(digest, dims, f".{fmt}", quality[fmt]) for fmt in formats},
+            })
+        
+        missing = [
+            variant for variant in variants
+            if not all((thumbs_dir / name).exists() for name in [variant['file'], *variant['formats'].values()])
+        ]
+        if missing:
+            # One decode for the whole ladder, scaled down as far as the largest size allows
+            largest = max(targets)
+            img.draft(img.mode, (largest[0] * 2, largest[1] * 2))
+            
+            # Each size is resized from the next larger one rather than from the decode
+            current = img
+            for variant in reversed(variants):
+                current = current.resize((variant['width'], variant['height']), Image.Resampling.LANCZOS)
+                if variant not in missing:
+                    continue
+                save(current, thumbs_dir / variant['file'], None, quality)
+                for fmt, name in variant['formats'].items():
+                    save(current, thumbs_dir / name, fmt, quality)
+            # current is the smallest rendition by now
+            placeholder = make_placeholder(current)
+        else:
+            with Image.open(thumbs_dir / variants[0]['file']) as smallest:
+                placeholder = make_placeholder(smallest)
+        
+        return {
+            'filename': img_path.name,
+            'thumbnail': asset_name(digest, thumb_dims, ext, ext_quality),
+            'renditions': variants,
+            'width': orig_width,
+            'height': orig_height,
+            'aspect_ratio': aspect_ratio,
+            'orientation': orientation,
+            'taken': taken,
+            'placeholder': placeholder,
+            'sha256': digest,
+            'needs_assets': False,
+        }
+
+
+def _process_image_task(args):
+    """Pool entry point: never raises, so one bad file can't stop the batch."""
+    img_path, thumbs_dir, options = args
+    try:
+        return process_image(img_path, thumbs_dir, **options), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _read_metadata_task(args):
+    """Like _process_image_task, for metadata-only builds."""
+    img_path, thumbs_dir, options = args
+    try:
+        return read_metadata(img_path), None
+    except Exception as e:
+        return None, str(e)
+
 
 class ImageGallery:
-    def __init__(self, input_dir, output_dir, thumbnail_size=(400, 400), columns=3, images_per_page=12):
+    def __init__(self, input_dir, output_dir, thumbnail_size=(400, 400), columns=3, images_per_page=12,
+                 workers=1, renditions=(200, 400, 800, 1600), formats=('webp',), thumbnail_quality=None,
+                 page_shards=False, layout='grid', originals_mode='copy', recursive=False,
+                 metadata_only=False, lazy_thumbnails=False, pipeline_threads=None, live_updates=False):
+        if layout not in LAYOUTS:
+            raise ValueError(f"layout must be one of {LAYOUTS}, not {layout!r}")
+        if layout != 'grid' and page_shards:
+            raise ValueError(f"the {layout} layout needs every image's metadata up front; it can't use page_shards")
+        if originals_mode not in ORIGINALS_MODES:
+            raise ValueError(f"originals_mode must be one of {ORIGINALS_MODES}, not {originals_mode!r}")
+        if originals_mode == 'serve-from-source' and Path(output_dir).resolve() == Path(input_dir).resolve():
+            raise ValueError("originals_mode='serve-from-source' needs an output directory other than the input")
+        if pipeline_threads and workers != 1:
+            raise ValueError("use either workers (processes) or pipeline_threads (threads), not both")
         self.input_dir = Path(input_dir)
         self.output_dir = Path(output_dir)
+        # Include images in subdirectories, named by their path relative to input_dir
+        self.recursive = recursive
+        # Index dimensions, orientation and capture date from file headers only and
+        # leave thumbnails for a later full build (entries are marked needs_assets)
+        self.metadata_only = metadata_only or lazy_thumbnails
+        # Point pages at GalleryServer's /thumb route for images without thumbnails,
+        # instead of rendering them at build time (implies metadata_only)
+        self.lazy_thumbnails = lazy_thumbnails
+        # How originals reach the output directory (see gallery_originals)
+        self.originals_mode = originals_mode
         self.thumb_size = thumbnail_size
+        # Longest-side sizes of the responsive set used for srcset and the lightbox
+        self.renditions = tuple(sorted(renditions))
+        # Modern formats ('webp', 'avif') offered through <picture> next to the legacy thumbnails
+        self.formats = supported_formats(formats)
+        for fmt in set(formats) - set(self.formats):
+            print(f"Warning: {fmt} thumbnails are not supported by this Pillow build, skipping")
+        # Per-format encoder quality overrides, e.g. {'jpeg': 90}
+        self.thumb_quality = thumbnail_quality
+        # Emit a small index.html shell plus pages/page-NNNN.json instead of every item inline
+        self.page_shards = page_shards
+        self.layout = layout
+        # Pages reload on /events pushes; only for galleries served by `--watch --serve`
+        self.live_updates = live_updates
         self.columns = columns
         self.images_per_page = images_per_page
+        # Number of processes used for thumbnailing (None = one per CPU)
+        self.workers = workers or os.cpu_count() or 1
+        # (readers, encoders, writers): thumbnail in one process with a staged thread
+        # pipeline instead (see gallery_pipeline); imported here since it imports us
+        self.pipeline = None
+        if pipeline_threads:
+            from gallery_pipeline import ThumbnailPipeline
+            self.pipeline = ThumbnailPipeline(*pipeline_threads)
         self.images = []
+        # likes.json is only read once, to seed likes.db for galleries built before the store
         self.likes_file = self.output_dir / 'likes.json'
+        self.likes_db = self.output_dir / 'likes.db'
+        self.likes_store = None
+        self.manifest = GalleryManifest(
+            self.output_dir / 'manifest.json',
+            settings=self.thumbnail_options()
+        )
+        # Tells GalleryServer where originals live when they aren't in the output directory
+        self.manifest.originals = {
+            'mode': originals_mode,
+            'source_dir': str(self.input_dir.resolve()),
+        }
 
     def process_images(self):
         thumbs_dir = self.output_dir / 'thumbnails'
         thumbs_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest.load()
         
-        for img_path in self.input_dir.glob('*'):
-            if img_path.suffix.lower() in ('.jpg', '.jpeg', '.png', '.gif'):
-                try:
-                    with Image.open(img_path) as img:
-                        # Get original dimensions
-                        orig_width, orig_height = img.size
-                        aspect_ratio = orig_width / orig_height
-                        
-                        # Calculate thumbnail dimensions
-                        if aspect_ratio > 1:
-                            thumb_width = self.thumb_size[0]
-                            thumb_height = int(thumb_width / aspect_ratio)
-                        else:
-                            thumb_height = self.thumb_size[1]
-                            thumb_width = int(thumb_height * aspect_ratio)
-                        
-                        # Create high-quality thumbnail
-                        thumb = img.copy()
-                        thumb.thumbnail((thumb_width, thumb_height), Image.Resampling.LANCZOS)
-                        thumb_path = thumbs_dir / f"thumb_{img_path.name}"
-                        
-                        # Save with high quality
-                        if img_path.suffix.lower() in ('.jpg', '.jpeg'):
-                            thumb.save(thumb_path, 'JPEG', quality=95)
-                        else:
-                            thumb.save(thumb_path)
-                        
-                        self.images.append({
-                            'filename': img_path.name,
-                            'thumbnail': thumb_path.name,
-                            'width': orig_width,
-                            'height': orig_height,
-                            'aspect_ratio': aspect_ratio
-                        })
-                except Exception as e:
-                    print(f"Error processing {img_path}: {e}")
+        # One listing instead of a stat per derived file of every unchanged image
+        with os.scandir(thumbs_dir) as entries:
+            existing = {entry.name for entry in entries}
+        
+        # The scan runs in a background thread while new or changed sources are
+        # decoded, so a large tree (or a slow mount) doesn't hold up the first thumbnail
+        names = []
+        # Subdirectories that couldn't be listed: their images are kept, not pruned
+        failed = []
+        unchanged = 0
+        def pending():
+            nonlocal unchanged
+            for name, img_path, stat in prefetch(self.scan(failed)):
+                names.append(name)
+                if self._is_up_to_date(name, img_path, stat, thumbs_dir, existing):
+                    unchanged += 1
+                else:
+                    yield name, img_path, stat
+        
+        processed = self._process(pending(), thumbs_dir)
+        self._prune_removed(names, failed)
+        self.manifest.save()
+        self._prune_thumbnails(thumbs_dir)
+        
+        # Sorted so self.images (and index.html) don't depend on directory order
+        self.images = [self.manifest.entries[name] for name in sorted(self.manifest.entries)]
+        if self.metadata_only:
+            print(f"Indexed {processed} new or changed images from their headers ({unchanged} unchanged, "
+                  f"{len(self.manifest.needing_assets())} without thumbnails yet)")
+        else:
+            print(f"Processed {processed} new or changed images ({unchanged} unchanged)")
 
         # Load existing likes if available
         self.load_likes()
 
-    def load_likes(self):
-        """Load likes from JSON file or initialize if not exists."""
-        if self.likes_file.exists():
+    def scan(self, failed=None):
+        """Yield ``(name, path, stat)`` for the source images (see gallery_scanner.scan_images)."""
+        return scan_images(self.input_dir, IMAGE_EXTENSIONS, recursive=self.recursive,
+                           exclude=[self.output_dir], failed=failed)
+
+    def update(self, paths):
+        """Bring the gallery up to date after ``paths`` were added, changed or deleted.
+
+        Only those sources are looked at, so the work doesn't depend on the
+        size of the gallery (apart from rewriting index.html). Returns the
+        names of the images that were (re)processed and of those removed.
+        """
+        thumbs_dir = self.output_dir / 'thumbnails'
+        pending = []
+        removed = []
+        # Derived files of replaced or deleted versions, deleted if nothing else uses them
+        stale = set()
+        for path in sorted({Path(p) for p in paths}):
+            name = relative_name(path, self.input_dir)
+            if name is None or path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            if ('/' in name and not self.recursive) or self._is_excluded(name):
+                continue
+            img_path = self.input_dir / name
+            old_entry = self.manifest.get(name)
             try:
-                with open(self.likes_file, 'r') as f:
-                    self.likes = json.load(f)
-            except (json.JSONDecodeError, IOError):
-                self.likes = {img['filename']: 0 for img in self.images}
+                stat = img_path.stat()
+            except FileNotFoundError:
+                if old_entry is not None:
+                    self.manifest.remove(name)
+                    self._remove_original(old_entry)
+                    stale.update(derived_files(old_entry))
+                    removed.append(name)
+                continue
+            if not self._is_up_to_date(name, img_path, stat, thumbs_dir):
+                pending.append((name, img_path, stat))
+                if old_entry is not None:
+                    stale.update(derived_files(old_entry))
+        
+        self._process(pending, thumbs_dir)
+        self.manifest.save()
+        self._prune_thumbnails(thumbs_dir, stale)
+        
+        self.images = [self.manifest.entries[name] for name in sorted(self.manifest.entries)]
+        self.load_likes()
+        updated = [name for name, _, _ in pending if self.manifest.get(name) is not None]
+        if updated or removed:
+            self.generate_html(originals=updated)
+        return updated, removed
+
+    def _is_excluded(self, name):
+        """Whether ``name`` is somewhere scan() never looks: hidden, or inside the output directory."""
+        if any(part.startswith('.') for part in name.split('/')):
+            return True
+        return relative_name(self.input_dir / name, self.output_dir) is not None
+
+    def _process(self, pending, thumbs_dir):
+        """Create thumbnails for ``pending`` ``(name, path, stat)`` sources and record them in the manifest.
+
+        ``pending`` is consumed lazily, so it can be a scan that's still
+        running. Returns how many succeeded; failures are reported and
+        dropped from the manifest.
+        """
+        options = self.thumbnail_options()
+        processed = 0
+        
+        def record(name, img_path, stat, result):
+            image, error = result
+            if error is not None:
+                print(f"Error processing {img_path}: {error}")
+                # Don't keep serving metadata for a source we can no longer read
+                self.manifest.remove(name)
+                return 0
+            image['filename'] = name
+            image['size'] = stat.st_size
+            image['mtime_ns'] = stat.st_mtime_ns
+            self.manifest.update(name, image)
+            return 1
+        
+        if self.pipeline is not None and not self.metadata_only:
+            for name, img_path, stat, result in self.pipeline.run(pending, thumbs_dir, options):
+                processed += record(name, img_path, stat, result)
+            if self.pipeline.wall and self.pipeline.stats['read'].items:
+                for line in self.pipeline.summary():
+                    print(f"  {line}")
+            return processed
+        
+        # Header reads are too cheap to be worth shipping to another process
+        if self.workers == 1 or self.metadata_only:
+            task = _read_metadata_task if self.metadata_only else _process_image_task
+            for name, img_path, stat in pending:
+                processed += record(name, img_path, stat, task((img_path, thumbs_dir, options)))
+            return processed
+        
+        # A few tasks per worker in flight keeps every process busy without
+        # queueing a whole tree's worth of futures; the pool only starts if there's work
+        executor = None
+        in_flight = deque()
+        try:
+            for name, img_path, stat in pending:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=self.workers)
+                future = executor.submit(_process_image_task, (img_path, thumbs_dir, options))
+                in_flight.append((name, img_path, stat, future))
+                if len(in_flight) >= self.workers * 4:
+                    name, img_path, stat, future = in_flight.popleft()
+                    processed += record(name, img_path, stat, future.result())
+            while in_flight:
+                name, img_path, stat, future = in_flight.popleft()
+                processed += record(name, img_path, stat, future.result())
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        return processed
+
+    def thumbnail_options(self):
+        """Keyword arguments for process_image; also stored in the manifest settings."""
+        return {
+            'thumb_size': list(self.thumb_size),
+            'renditions': list(self.renditions),
+            'formats': list(self.formats),
+            'quality': self.thumb_quality,
+        }
+
+    def _is_up_to_date(self, name, img_path, stat, thumbs_dir, existing=None):
+        """Check the manifest, hashing only when size or mtime changed.
+
+        ``existing`` is the set of files in ``thumbs_dir`` when the caller
+        listed it already, saving a stat per derived file.
+        """
+        entry = self.manifest.get(name)
+        if entry is None or (entry['needs_assets'] and not self.metadata_only):
+            return False
+        if existing is None:
+            if not all((thumbs_dir / derived).exists() for derived in derived_files(entry)):
+                return False
+        elif not existing.issuperset(derived_files(entry)):
+            return False
+        if self.manifest.lookup(name, stat) is not None:
+            return True
+        if self.metadata_only:
+            # Re-reading the header is cheaper than hashing the whole file
+            return False
+        # Touched but identical content (e.g. re-copied) keeps its thumbnail
+        if entry['sha256'] == file_digest(img_path):
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+            return True
+        return False
+
+    def _prune_removed(self, names, unscanned=()):
+        """Drop manifest entries and copied or linked originals of deleted sources.
+
+        Sources under the ``unscanned`` prefixes weren't listed, so they are left alone.
+        """
+        for entry in self.manifest.prune(names, unscanned):
+            self._remove_original(entry)
+
+    def _remove_original(self, entry):
+        original = self.output_dir / entry['filename']
+        if original.exists() or original.is_symlink():
+            original.unlink()
+        # Subdirectories (recursive galleries) go with their last original
+        for parent in original.parents:
+            if parent == self.output_dir:
+                break
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+
+    def _prune_thumbnails(self, thumbs_dir, candidates=None):
+        """Delete derived files no manifest entry references any more.
+
+        Thumbnails can be shared by duplicate sources, so they are only removed
+        once nothing points at them: after a source is deleted or changed, or
+        when the build settings change. With ``candidates`` only those names
+        are checked instead of listing the whole directory.
+        """
+        referenced = set()
+        for entry in self.manifest.entries.values():
+            referenced.update(derived_files(entry))
+        if candidates is not None:
+            for name in set(candidates) - referenced:
+                path = thumbs_dir / name
+                if path.exists():
+                    path.unlink()
+            return
+        with os.scandir(thumbs_dir) as entries:
+            for dir_entry in entries:
+                if dir_entry.is_file() and dir_entry.name not in referenced:
+                    os.unlink(dir_entry.path)
+
+    def _write_page_shards(self):
+        """Write pages/page-NNNN.json: the rendered items and metadata of each page."""
+        pages_dir = self.output_dir / 'pages'
+        pages_dir.mkdir(exist_ok=True)
+        page_names = set()
+        for start in range(0, len(self.images), self.images_per_page):
+            page_images = self.images[start:start + self.images_per_page]
+            shard = json.dumps({
+                'html': ''.join(self._render_item(start + i, img) for i, img in enumerate(page_images)),
+                'images': [self._image_data(img) for img in page_images],
+            })
+            page_path = pages_dir / f"page-{start // self.images_per_page + 1:04d}.json"
+            page_names.add(page_path.name)
+            # Unchanged pages keep their mtime (and HTTP caches stay valid)
+            if page_path.exists() and page_path.read_text(encoding='utf-8') == shard:
+                continue
+            tmp_path = page_path.with_name(page_path.name + '.tmp')
+            tmp_path.write_text(shard, encoding='utf-8')
+            os.replace(tmp_path, page_path)
+        
+        # Pages past the end from a previously larger gallery
+        for page_path in pages_dir.glob('page-*.json'):
+            if page_path.name not in page_names:
+                page_path.unlink()
+
+    def _render_item(self, idx, img):
+        """Markup for one .gallery-item."""
+        span_class = 'wide' if img['aspect_ratio'] > WIDE_ASPECT_RATIO else ''
+        likes_count = self.likes.get(img['filename'], 0)
+        sizes = GRID_SIZES_WIDE if span_class else GRID_SIZES
+        sources = ''.join(
+            f'<source type="{MIME_TYPES[fmt]}" srcset="{self._srcset(img, fmt)}" sizes="{sizes}">'
+            for fmt in self.formats if img['renditions']
+        )
+        lazy_sizes = self._lazy_sizes(img)
+        if img['thumbnail']:
+            src, srcset = f"thumbnails/{img['thumbnail']}", self._srcset(img)
+        elif lazy_sizes:
+            # Rendered by GalleryServer on first request (see gallery_thumbcache)
+            urls = [(f"thumb/{size}/{quote(img['filename'])}", width) for size, width in lazy_sizes]
+            src, srcset = urls[0][0], ', '.join(f"{url} {width}w" for url, width in urls)
         else:
-            self.likes = {img['filename']: 0 for img in self.images}
+            # Metadata-only builds have no thumbnails yet; the original stands in
+            src, srcset = quote(img['filename']), ''
+        
+        # Blurred preview until the thumbnail arrives, without an extra request
+        placeholder = img['placeholder']
+        background = ''
+        if placeholder is not None:
+            background = f"background: {placeholder['color']} url({placeholder['data_uri']}) center / cover no-repeat"
+
+        return f"""
+                <div class="gallery-item {span_class}" data-index="{idx}" data-filename="{img['filename']}" style="{background}" onclick="openLightbox({idx})">
+                    <picture>{sources}<img src="{src}" 
+                         srcset="{srcset}"
+                         sizes="{sizes}"
+                         alt="{img['filename']}"
+                         loading="lazy"></picture>
+                    <div class="like-container">
+                        <button class="like-button" onclick="event.stopPropagation(); toggleLike('{img['filename']}')">
+                            <span class="heart-icon">❤️</span>
+                            <span class="like-count">{likes_count}</span>
+                        </button>
+                    </div>
+                </div>
+            """
+
+    def _lazy_sizes(self, img):
+        """``[(size, width)]`` of the renditions GalleryServer's /thumb route makes for ``img``.
+
+        Empty unless the gallery uses lazy_thumbnails and the image has no
+        thumbnails of its own. Like process_image, sizes that would upscale are left out.
+        """
+        if not (self.lazy_thumbnails and img['needs_assets']):
+            return []
+        widths = {}
+        for size in self.renditions:
+            width = thumbnail_dimensions(img['width'], img['height'], (size, size))[0]
+            if width < img['width'] and width not in widths:
+                widths[width] = size
+        return [(size, width) for width, size in sorted(widths.items())]
+
+    def _image_data(self, img):
+        """The per-image metadata the page script needs."""
+        lazy_sizes = self._lazy_sizes(img)
+        if lazy_sizes:
+            # [size, width] pairs; the page asks /thumb/<size>/<filename> for them
+            renditions = [[size, width, {}] for size, width in lazy_sizes]
+        else:
+            renditions = [[r['file'], r['width'], r['formats']] for r in img['renditions']]
+        return {
+            'filename': img['filename'],
+            'width': img['width'],
+            'wide': img['aspect_ratio'] > WIDE_ASPECT_RATIO,
+            'aspect_ratio': round(img['aspect_ratio'], 4),
+            # Only the colour: the previews would add ~200 bytes per image to the inline metadata
+            'color': img['placeholder']['color'] if img['placeholder'] else '',
+            'renditions': renditions,
+            'lazy': bool(lazy_sizes),
+        }
+
+    @staticmethod
+    def _srcset(img, fmt=None):
+        """srcset for an image's renditions, in the source format or a modern one."""
+        return ', '.join(
+            f"thumbnails/{quote(r['formats'][fmt] if fmt else r['file'])} {r['width']}w"
+            for r in img['renditions']
+        )
+
+    def load_likes(self):
+        """Load likes from the likes store, importing a legacy likes.json on first use."""
+        if self.likes_store is None:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.likes_store = LikesStore(self.likes_db)
+            self.likes_store.import_json(self.likes_file)
+        counts = self.likes_store.get_all()
+        self.likes = {img['filename']: counts.get(img['filename'], 0) for img in self.images}
 
     def save_likes(self):
-        """Save likes to JSON file."""
-        with open(self.likes_file, 'w') as f:
-            json.dump(self.likes, f)
+        """Make sure every image has a count in the likes store.
+
+        Existing counts are left alone, so a build never overwrites likes a
+        running server recorded meanwhile.
+        """
+        self.likes_store.ensure(img['filename'] for img in self.images)
+
+    def render_html(self, live_updates=False):
+        """Yield index.html piece by piece.
 
-    def generate_html(self):
+        Nothing holds the whole page, so memory use during generation doesn't
+        grow with the number of images. ``live_updates`` makes the page listen
+        on GalleryServer's /events stream, which only a server running next to
+        a GalleryWatcher provides.
+        """
         css = """
         <style>
             :root {
@@ -138,6 +766,17 @@ class ImageGallery:
                 grid-column: span 2;
             }
             
+            /* Virtual layout: the script sizes the gallery and positions each item */
+            .gallery.virtual {
+                display: block;
+                position: relative;
+                box-sizing: border-box;
+            }
+            
+            .gallery.virtual .gallery-item {
+                position: absolute;
+            }
+            
             /* Pagination styles */
             .pagination {
                 display: flex;
@@ -407,63 +1046,402 @@ class ImageGallery:
         
         js = """
         <script>
-            function fetchLikes(url) {
-                let data = null;
-                const xhr = new XMLHttpRequest();
-                xhr.open('GET', url, false);  // false makes it synchronous
-                xhr.send();
-                
-                if (xhr.status === 200) {
-                    data = JSON.parse(xhr.responseText);
-                }
-                return data;
-            }
             let currentIndex = 0;
             let currentPage = 1;
-            const images = %s;
             const imagesPerPage = %d;
+            const pageShards = %s;
+            const layout = %s;
+            const liveUpdates = %s;
+            const gridSizes = %s;
+            const gridSizesWide = %s;
             const totalPages = Math.ceil(images.length / imagesPerPage);
             let touchStartX = 0;
             let touchEndX = 0;
-            let likes = fetchLikes('/likes') || {};
+            // Counts known so far; the build-time counts stay on screen until a page's arrive
+            const likes = {};
+
+            // After a reload (e.g. on a live update) revalidate instead of trusting cached pages
+            const navigation = performance.getEntriesByType('navigation')[0];
+            const fetchCache = navigation && navigation.type === 'reload' ? 'no-cache' : 'default';
+
+            // Sharded galleries fetch pages/page-NNNN.json on demand; inline ones have everything already
+            const pageRequests = {};
+            function loadPage(page) {
+                if (!pageShards) return Promise.resolve(null);
+                if (!pageRequests[page]) {
+                    const url = `pages/page-${String(page).padStart(4, '0')}.json`;
+                    pageRequests[page] = fetch(url, { cache: fetchCache }).then(response => {
+                        if (!response.ok) {
+                            throw new Error(`HTTP error! status: ${response.status}`);
+                        }
+                        return response.json();
+                    })
+                    .then(shard => {
+                        const start = (page - 1) * imagesPerPage;
+                        shard.images.forEach((image, i) => { images[start + i] = image; });
+                        return shard;
+                    })
+                    .catch(error => {
+                        // Allow a retry on the next navigation
+                        delete pageRequests[page];
+                        throw error;
+                    });
+                }
+                return pageRequests[page];
+            }
+
+            function ensureImage(index) {
+                return loadPage(Math.floor(index / imagesPerPage) + 1);
+            }
+
+            // One small request per page for just that page's counts, off the critical path
+            const likesRequests = {};
+            function loadLikes(page) {
+                if (!likesRequests[page]) {
+                    const start = (page - 1) * imagesPerPage;
+                    const params = new URLSearchParams();
+                    images.slice(start, start + imagesPerPage).forEach(image => params.append('files', image.filename));
+                    // Always revalidate (a cheap 304): a copy cached before a like would undo it on screen
+                    likesRequests[page] = fetch(`/likes?${params}`, {cache: 'no-cache'}).then(response => {
+                        if (!response.ok) {
+                            throw new Error(`HTTP error! status: ${response.status}`);
+                        }
+                        return response.json();
+                    })
+                    .then(counts => {
+                        Object.assign(likes, counts);
+                        return counts;
+                    })
+                    .finally(() => {
+                        // Revisiting the page later fetches fresh counts
+                        delete likesRequests[page];
+                    });
+                }
+                return likesRequests[page];
+            }
+
+            function refreshLikes(page) {
+                loadLikes(page).then(counts => {
+                    const start = (page - 1) * imagesPerPage;
+                    for (let i = start; i < start + imagesPerPage && i < images.length; i++) {
+                        const galleryItem = itemCache[i];
+                        if (galleryItem && images[i].filename in counts) {
+                            galleryItem.querySelector('.like-count').textContent = counts[images[i].filename];
+                        }
+                    }
+                    const lightboxImage = images[currentIndex];
+                    if (lightboxImage && lightboxImage.filename in counts) {
+                        document.getElementById('lightbox-like-count').textContent = counts[lightboxImage.filename];
+                    }
+                })
+                .catch(error => {
+                    console.error('Error loading likes:', error);
+                });
+            }
+
+            // Gallery items by index, so a page flip never searches the whole grid
+            const itemCache = [];
+            function cacheItems(container) {
+                for (const item of container.children) {
+                    itemCache[Number(item.dataset.index)] = item;
+                }
+            }
+
+            // [start, end) of the items currently marked visible
+            let visibleRange = [0, 0];
 
             // Pagination functions
             function showPage(page) {
                 currentPage = page;
-                const start = (page - 1) * imagesPerPage;
-                const end = start + imagesPerPage;
+                // Kept in the URL so a reload comes back to the same page
+                history.replaceState(null, '', `#page=${page}`);
+                
+                // Update pagination buttons
+                document.getElementById('prevPage').disabled = page === 1;
+                document.getElementById('nextPage').disabled = page === totalPages;
+                document.getElementById('currentPage').textContent = `${page} / ${totalPages}`;
                 
-                // Hide all items
-                document.querySelectorAll('.gallery-item').forEach(item => {
-                    item.classList.remove('visible');
+                loadPage(page).then(shard => {
+                    // A later navigation may have overtaken this one
+                    if (page !== currentPage) return;
+                    if (shard) {
+                        const gallery = document.querySelector('.gallery');
+                        gallery.innerHTML = shard.html;
+                        itemCache.length = 0;
+                        visibleRange = [0, 0];
+                        cacheItems(gallery);
+                    }
+                    performance.mark('gallery:renderPage:start');
+                    renderPage(page);
+                    // Page flip cost, for the browser's performance tools or
+                    // performance.getEntriesByName('gallery:renderPage')
+                    performance.measure('gallery:renderPage', 'gallery:renderPage:start');
+                    refreshLikes(page);
+                })
+                .catch(error => {
+                    console.error('Error loading page:', error);
                 });
+            }
+
+            function renderPage(page) {
+                const start = (page - 1) * imagesPerPage;
+                const end = Math.min(start + imagesPerPage, images.length);
+                
+                // Hide the previous page's items; every other item is hidden already
+                for (let i = visibleRange[0]; i < visibleRange[1]; i++) {
+                    if (itemCache[i]) itemCache[i].classList.remove('visible');
+                }
                 
                 // Show items for current page
-                for (let i = start; i < end && i < images.length; i++) {
-                    const galleryItem = document.querySelector(`[data-index="${i}"]`)
+                for (let i = start; i < end; i++) {
+                    const galleryItem = itemCache[i];
                     galleryItem.classList.add('visible');
                     const likeButton = galleryItem.querySelector('.like-button');
                     const likeCountEl = galleryItem.querySelector('.like-count');
                     likeButton.classList.add('liked');
-                    likeCountEl.textContent = likes[images[i].filename];
+                    if (images[i].filename in likes) {
+                        likeCountEl.textContent = likes[images[i].filename];
+                    }
                 }
-                
-                // Update pagination buttons
-                document.getElementById('prevPage').disabled = page === 1;
-                document.getElementById('nextPage').disabled = page === totalPages;
-                document.getElementById('currentPage').textContent = `${page} / ${totalPages}`;
+                visibleRange = [start, end];
                 
                 // Scroll to top of gallery
                 document.querySelector('.gallery').scrollIntoView({ behavior: 'smooth' });
             }
             
+            // Virtual and justified layouts: only rows near the viewport get elements,
+            // which are recycled as they scroll out. Rows are either computed from the
+            // metadata the way the CSS grid would place the items (virtual), or taken
+            // from the row tables precomputed at build time (justified).
+            const overscanRows = 2;
+            const itemPool = [];
+            let gridLayout = null;
+
+            function gridMetrics() {
+                // Mirrors the .gallery CSS, including its max-width: 768px override
+                return window.matchMedia('(max-width: 768px)').matches
+                    ? {minColumnWidth: 300, rowHeight: 250, gap: 10, padding: 10, wideSpan: 1}
+                    : {minColumnWidth: 350, rowHeight: 300, gap: 20, padding: 20, wideSpan: 2};
+            }
+
+            function computeLayout() {
+                const gallery = document.querySelector('.gallery');
+                const metrics = gridMetrics();
+                const innerWidth = gallery.clientWidth - 2 * metrics.padding;
+                const rows = layout === 'justified'
+                    ? justifiedRowsFor(innerWidth)
+                    : gridRowsFor(innerWidth, metrics);
+                const itemLeft = new Float64Array(images.length);
+                const itemWidth = new Float64Array(images.length);
+                const rowStarts = new Int32Array(rows.length + 1);
+                const rowTops = new Float64Array(rows.length);
+                const rowHeights = new Float64Array(rows.length);
+                let index = 0;
+                let top = metrics.padding;
+                rows.forEach((row, r) => {
+                    rowStarts[r] = index;
+                    rowTops[r] = top;
+                    rowHeights[r] = row.height;
+                    row.items.forEach(([left, width]) => {
+                        itemLeft[index] = metrics.padding + left;
+                        itemWidth[index] = width;
+                        index++;
+                    });
+                    top += row.height + row.gap;
+                });
+                rowStarts[rows.length] = index;
+                const bottom = rows.length ? top - rows[rows.length - 1].gap : top;
+                gallery.style.height = `${bottom + metrics.padding}px`;
+                gridLayout = {
+                    itemLeft, itemWidth, rowStarts, rowTops, rowHeights,
+                    top: gallery.getBoundingClientRect().top + window.scrollY,
+                };
+            }
+
+            // Rows as the CSS grid would auto-place items: without backfilling, so a
+            // wide item that doesn't fit starts the next row
+            function gridRowsFor(innerWidth, metrics) {
+                const columns = Math.max(1, Math.floor((innerWidth + metrics.gap) / (metrics.minColumnWidth + metrics.gap)));
+                const columnWidth = (innerWidth - metrics.gap * (columns - 1)) / columns;
+                const rows = [];
+                let row = null;
+                let column = columns;
+                images.forEach(image => {
+                    const span = image.wide ? Math.min(metrics.wideSpan, columns) : 1;
+                    if (column + span > columns) {
+                        row = {height: metrics.rowHeight, gap: metrics.gap, items: []};
+                        rows.push(row);
+                        column = 0;
+                    }
+                    row.items.push([column * (columnWidth + metrics.gap), span * columnWidth + (span - 1) * metrics.gap]);
+                    column += span;
+                });
+                return rows;
+            }
+
+            // The widest precomputed table that fits, scaled to the exact width, so
+            // every image keeps its aspect ratio and nothing moves once thumbnails load
+            function justifiedRowsFor(innerWidth) {
+                const table = justifiedRows.reduce((best, t) => t.width <= innerWidth ? t : best, justifiedRows[0]);
+                const scale = innerWidth / table.width;
+                const gap = table.gap * scale;
+                let index = 0;
+                return table.rows.map(([count, height]) => {
+                    const rowHeight = height * scale;
+                    const items = [];
+                    let left = 0;
+                    for (let i = index; i < index + count; i++) {
+                        const width = images[i].aspect_ratio * rowHeight;
+                        items.push([left, width]);
+                        left += width + gap;
+                    }
+                    index += count;
+                    return {height: rowHeight, gap, items};
+                });
+            }
+
+            // Last row starting at or above y
+            function rowAt(y) {
+                const rowTops = gridLayout.rowTops;
+                let low = 0;
+                let high = rowTops.length - 1;
+                while (low < high) {
+                    const mid = (low + high + 1) >> 1;
+                    if (rowTops[mid] <= y) {
+                        low = mid;
+                    } else {
+                        high = mid - 1;
+                    }
+                }
+                return low;
+            }
+
+            function createItem(gallery) {
+                const item = document.createElement('div');
+                item.className = 'gallery-item';
+                const picture = document.createElement('picture');
+                // Same <source> types as the lightbox
+                document.querySelectorAll('#lightbox-picture source').forEach(source => {
+                    picture.appendChild(source.cloneNode());
+                });
+                const img = document.createElement('img');
+                img.loading = 'lazy';
+                picture.appendChild(img);
+                item.appendChild(picture);
+                item.insertAdjacentHTML('beforeend',
+                    '<div class="like-container"><button class="like-button">' +
+                    '<span class="heart-icon">❤️</span><span class="like-count"></span></button></div>');
+                item.onclick = () => openLightbox(Number(item.dataset.index));
+                item.querySelector('.like-button').onclick = event => {
+                    event.stopPropagation();
+                    toggleLike(item.dataset.filename);
+                };
+                gallery.appendChild(item);
+                return item;
+            }
+
+            function fillItem(item, index) {
+                const image = images[index];
+                // Justified items have an exact width; grid items follow the CSS columns
+                const sizes = layout === 'justified'
+                    ? `${Math.ceil(gridLayout.itemWidth[index])}px`
+                    : (image.wide ? gridSizesWide : gridSizes);
+                item.dataset.index = index;
+                item.dataset.filename = image.filename;
+                item.style.background = image.color;
+                item.classList.toggle('wide', image.wide);
+                item.querySelectorAll('source').forEach(source => {
+                    source.sizes = sizes;
+                    source.srcset = srcsetFor(image, source.dataset.format);
+                });
+                const img = item.querySelector('img');
+                img.sizes = sizes;
+                img.srcset = srcsetFor(image);
+                // Metadata-only builds have no thumbnails yet; the original stands in
+                img.src = image.renditions.length ? renditionUrl(image, image.renditions[0]) : originalUrl(image);
+                img.alt = image.filename;
+                item.querySelector('.like-button').classList.add('liked');
+                item.querySelector('.like-count').textContent = image.filename in likes ? likes[image.filename] : '';
+            }
+
+            function renderWindow() {
+                const gallery = document.querySelector('.gallery');
+                const {itemLeft, itemWidth, rowStarts, rowTops, rowHeights} = gridLayout;
+                const rows = rowTops.length;
+                const viewTop = window.scrollY - gridLayout.top;
+                const lastRow = Math.min(rows, rowAt(viewTop + window.innerHeight) + 1 + overscanRows);
+                const firstRow = Math.min(lastRow, Math.max(0, rowAt(viewTop) - overscanRows));
+                const start = rowStarts[firstRow];
+                const end = rowStarts[lastRow];
+
+                // Items that scrolled out go back to the pool
+                for (let i = visibleRange[0]; i < visibleRange[1]; i++) {
+                    if ((i < start || i >= end) && itemCache[i]) {
+                        itemCache[i].classList.remove('visible');
+                        itemPool.push(itemCache[i]);
+                        itemCache[i] = undefined;
+                    }
+                }
+
+                for (let row = firstRow; row < lastRow; row++) {
+                    for (let i = rowStarts[row]; i < rowStarts[row + 1]; i++) {
+                        let item = itemCache[i];
+                        if (!item) {
+                            item = itemPool.pop() || createItem(gallery);
+                            fillItem(item, i);
+                            item.classList.add('visible');
+                            itemCache[i] = item;
+                        }
+                        item.style.top = `${rowTops[row]}px`;
+                        item.style.left = `${itemLeft[i]}px`;
+                        item.style.width = `${itemWidth[i]}px`;
+                        item.style.height = `${rowHeights[row]}px`;
+                    }
+                }
+                visibleRange = [start, end];
+                scheduleLikes();
+            }
+
+            let windowFrame = null;
+            function scheduleWindow() {
+                if (windowFrame === null) {
+                    windowFrame = requestAnimationFrame(() => {
+                        windowFrame = null;
+                        renderWindow();
+                    });
+                }
+            }
+
+            // Once scrolling settles, fetch counts for pages in view that haven't been loaded
+            let likesTimer = null;
+            function scheduleLikes() {
+                clearTimeout(likesTimer);
+                likesTimer = setTimeout(() => {
+                    const [start, end] = visibleRange;
+                    if (start >= end) return;
+                    for (let page = Math.floor(start / imagesPerPage) + 1; (page - 1) * imagesPerPage < end; page++) {
+                        if (!(images[(page - 1) * imagesPerPage].filename in likes)) {
+                            refreshLikes(page);
+                        }
+                    }
+                }, 200);
+            }
+
             function nextPage() {
+                if (layout !== 'grid') {
+                    window.scrollBy(0, window.innerHeight);
+                    return;
+                }
                 if (currentPage < totalPages) {
                     showPage(currentPage + 1);
                 }
             }
             
             function prevPage() {
+                if (layout !== 'grid') {
+                    window.scrollBy(0, -window.innerHeight);
+                    return;
+                }
                 if (currentPage > 1) {
                     showPage(currentPage - 1);
                 }
@@ -479,6 +1457,7 @@ class ImageGallery:
             
             function closeLightbox() {
                 document.getElementById('lightbox').classList.remove('active');
+                reloadIfUpdated();
             }
             
             function nextImage() {
@@ -496,11 +1475,61 @@ class ImageGallery:
                     `${currentIndex + 1} / ${images.length}`;
             }
             
+            // Responsive renditions as a srcset string, in the source format unless a
+            // modern format is given; the lightbox also offers the original
+            function srcsetFor(image, format = null, includeOriginal = false) {
+                // Lazily rendered thumbnails only come in the source format
+                const renditions = format && image.lazy ? [] : image.renditions;
+                const candidates = renditions.map(r => `${renditionUrl(image, r, format)} ${r[1]}w`);
+                if (includeOriginal) {
+                    candidates.push(`${originalUrl(image)} ${image.width}w`);
+                }
+                return candidates.join(', ');
+            }
+
+            function renditionUrl(image, rendition, format = null) {
+                if (image.lazy) {
+                    // Rendered by the server on first request
+                    return `thumb/${rendition[0]}/${originalUrl(image)}`;
+                }
+                return `thumbnails/${encodeURIComponent(format ? rendition[2][format] : rendition[0])}`;
+            }
+
+            // Keeps the '/' of images from subdirectories, so static servers find them too
+            function originalUrl(image) {
+                return image.filename.split('/').map(encodeURIComponent).join('/');
+            }
+
             function updateLightboxImage() {
+                const index = currentIndex;
+                updateCounter();
+                ensureImage(index).then(() => {
+                    if (index === currentIndex) showLightboxImage();
+                })
+                .catch(error => {
+                    console.error('Error loading image:', error);
+                });
+            }
+
+            function showLightboxImage() {
                 const img = document.getElementById('lightbox-image');
-                img.src = images[currentIndex].filename;
+                // Let the browser pick a screen-sized rendition instead of the full original
+                document.querySelectorAll('#lightbox-picture source').forEach(source => {
+                    source.sizes = '90vw';
+                    source.srcset = srcsetFor(images[currentIndex], source.dataset.format);
+                });
+                img.sizes = '90vw';
+                img.srcset = srcsetFor(images[currentIndex], null, true);
+                img.src = originalUrl(images[currentIndex]);
                 let likeContainer = document.querySelector('.lightbox-like-count');
-                likeContainer.textContent = likes[images[currentIndex].filename];
+                const filename = images[currentIndex].filename;
+                if (filename in likes) {
+                    likeContainer.textContent = likes[filename];
+                } else {
+                    // An image from a page that hasn't been shown yet
+                    likeContainer.textContent = '';
+                    refreshLikes(Math.floor(currentIndex / imagesPerPage) + 1);
+                }
                 updateCounter();
             }
 
@@ -558,13 +1587,9 @@ class ImageGallery:
                 // Update like button and count
                 updateLikeButton(filename, isLightbox);
 
-                // Save likes to server (you'd replace this with actual backend logic)
-                fetch('/save-likes', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify(likes)
+                // Send just this like; the server answers with the authoritative count
+                fetch(`/likes/${encodeURIComponent(filename)}/increment`, {
+                    method: 'POST'
                 }).then(response => {
                     if (!response.ok) {
                         throw new Error(`HTTP error! status: ${response.status}`);
@@ -572,13 +1597,14 @@ class ImageGallery:
                     return response.json();
                 })
                 .then(data => {
+                    likes[filename] = data.likes;
+                    updateLikeButton(filename, isLightbox);
                     return data;
                 })
                 .catch(error => {
                     console.error('Error saving likes:', error);
                     return null;
                 });
-                likes = likes || fetchLikes('/likes');
             }
 
             function updateLikeButton(filename, isLightbox = false) {
@@ -591,7 +1617,11 @@ class ImageGallery:
                     lightboxLikeButton.classList.add('liked');
                     lightboxLikeCount.textContent = likeCount;
                 } else {
-                    const galleryItem = document.querySelector(`.gallery-item[data-filename="${filename}"]`);
+                    // Grid like buttons are only clickable on the visible page
+                    let galleryItem = null;
+                    for (let i = visibleRange[0]; i < visibleRange[1]; i++) {
+                        if (images[i].filename === filename) galleryItem = itemCache[i];
+                    }
                     if (galleryItem) {
                         const likeButton = galleryItem.querySelector('.like-button');
                         const likeCountEl = galleryItem.querySelector('.like-count');
@@ -609,14 +1639,20 @@ class ImageGallery:
                 document.getElementById('lightbox').classList.add('active');
                 updateCounter();
                 
-                // Reset like button state
-                const lightboxLikeButton = document.getElementById('lightbox-like-button');
-                const lightboxLikeCount = document.getElementById('lightbox-like-count');
-                const currentFilename = images[currentIndex].filename;
-                
-                lightboxLikeButton.classList.remove('liked');
-                lightboxLikeButton.onclick = () => toggleLike(currentFilename, true);
-                lightboxLikeCount.textContent = likes[currentFilename] || 0;
+                // Reset like button state (once a sharded gallery has loaded the image)
+                ensureImage(index).then(() => {
+                    if (index !== currentIndex) return;
+                    const lightboxLikeButton = document.getElementById('lightbox-like-button');
+                    const lightboxLikeCount = document.getElementById('lightbox-like-count');
+                    const currentFilename = images[currentIndex].filename;
+                    
+                    lightboxLikeButton.classList.remove('liked');
+                    lightboxLikeButton.onclick = () => toggleLike(currentFilename, true);
+                    if (currentFilename in likes) {
+                        lightboxLikeCount.textContent = likes[currentFilename];
+                    }
+                })
+                .catch(() => {});
             }
 
             // Keyboard navigation (updated to include like feature)
@@ -637,14 +1673,48 @@ class ImageGallery:
                 }
             });
             
+            // Live updates from a watching build (python gallery.py --watch --serve). The page
+            // reloads itself, but not while someone is looking at an image in the lightbox
+            let galleryUpdated = false;
+            function reloadIfUpdated() {
+                if (galleryUpdated && !document.getElementById('lightbox').classList.contains('active')) {
+                    location.reload();
+                }
+            }
+            if (liveUpdates && window.EventSource) {
+                new EventSource('/events').addEventListener('gallery-update', () => {
+                    galleryUpdated = true;
+                    reloadIfUpdated();
+                });
+            }
+
             // Initialize gallery
             document.addEventListener('DOMContentLoaded', function() {
-                showPage(1);
+                if (layout !== 'grid') {
+                    computeLayout();
+                    renderWindow();
+                    window.addEventListener('scroll', scheduleWindow, { passive: true });
+                    window.addEventListener('resize', () => {
+                        computeLayout();
+                        scheduleWindow();
+                    });
+                    return;
+                }
+                cacheItems(document.querySelector('.gallery'));
+                const pageMatch = /page=(\\d+)/.exec(location.hash);
+                showPage(pageMatch ? Math.min(Math.max(1, Number(pageMatch[1])), Math.max(1, totalPages)) : 1);
             });
         </script>
-        """ % (str([{'filename': img['filename']} for img in self.images]), self.images_per_page)
+        """ % (
+            self.images_per_page,
+            'true' if self.page_shards else 'false',
+            json.dumps(self.layout),
+            'true' if live_updates else 'false',
+            json.dumps(GRID_SIZES),
+            json.dumps(GRID_SIZES_WIDE),
+        )
         
-        html = f"""
+        yield f"""
         <!DOCTYPE html>
         <html>
         <head>
@@ -654,36 +1724,30 @@ class ImageGallery:
             {css}
         </head>
         <body>
-            <div class="gallery">
+            <div class="{'gallery' if self.layout == 'grid' else 'gallery virtual'}">
         """
         
-        for idx, img in enumerate(self.images):
-            span_class = 'wide' if img['aspect_ratio'] > 1.7 else ''
-            likes_count = self.likes.get(img['filename'], 0)
-            
-            html += f"""
-                <div class="gallery-item {span_class}" data-index="{idx}" data-filename="{img['filename']}" onclick="openLightbox({idx})">
-                    <img src="thumbnails/{img['thumbnail']}" 
-                         alt="{img['filename']}"
-                         loading="lazy">
-                    <div class="like-container">
-                        <button class="like-button" onclick="event.stopPropagation(); toggleLike('{img['filename']}')">
-                            <span class="heart-icon">❤️</span>
-                            <span class="like-count">{likes_count}</span>
-                        </button>
-                    </div>
-                </div>
-            """
+        # Sharded galleries load their items from pages/*.json instead, and
+        # the scrolling layouts create them from the metadata as they come into view
+        if self.layout == 'grid' and not self.page_shards:
+            for idx, img in enumerate(self.images):
+                yield self._render_item(idx, img)
         
-        html += """
+        yield """
             </div>
-            
+        """
+        
+        if self.layout == 'grid':
+            yield """
             <!-- Pagination -->
             <div class="pagination">
                 <button id="prevPage" onclick="prevPage()">← Previous</button>
                 <span id="currentPage" class="current-page">1 / 1</span>
                 <button id="nextPage" onclick="nextPage()">Next →</button>
             </div>
+        """
+        
+        yield """
 
             <!-- Random Image Button -->
             <div class="random-image-btn" onclick="showRandomImage()" title="Show Random Image">
@@ -693,7 +1757,7 @@ class ImageGallery:
             <!-- Lightbox -->
             <div id="lightbox" class="lightbox" onclick="closeLightbox()">
                 <div class="lightbox-content" onclick="event.stopPropagation()">
-                    <img id="lightbox-image" class="lightbox-image" src="" alt="Full size image">
+                    <picture id="lightbox-picture">%s<img id="lightbox-image" class="lightbox-image" src="" alt="Full size image"></picture>
                     <button class="lightbox-nav prev-button" onclick="prevImage()">←</button>
                     <button class="lightbox-nav next-button" onclick="nextImage()">→</button>
                     <button class="close-button" onclick="closeLightbox()">×</button>
@@ -708,28 +1772,73 @@ class ImageGallery:
                     </div>
                 </div>
             </div>
+        """ % ''.join(
+            f'<source data-format="{fmt}" type="{MIME_TYPES[fmt]}">' for fmt in self.formats
+        )
+        
+        # Image metadata gets its own script so it can be streamed one entry at a time
+        yield """
+        <script>
+            const images = """
+        if self.page_shards:
+            # Filled in page by page, so the initial payload doesn't grow with the gallery
+            yield f"new Array({len(self.images)});"
+        else:
+            yield "["
+            for idx, img in enumerate(self.images):
+                yield ('' if idx == 0 else ',') + '\n                ' + json.dumps(self._image_data(img))
+            yield """
+            ];"""
+        if self.layout == 'justified':
+            # Same rounding as the aspect ratios the page positions items with
+            layouts = justified_layouts([round(img['aspect_ratio'], 4) for img in self.images])
+            yield """
+            const justifiedRows = ["""
+            for idx, table in enumerate(layouts):
+                yield ('' if idx == 0 else ',') + '\n                ' + json.dumps(table, separators=(',', ':'))
+            yield """
+            ];"""
+        yield """
+        </script>
         """
         
-        html += js + """
+        yield js + """
         </body>
         </html>
         """
+
+    def generate_html(self, originals=None):
+        """Write index.html (and page shards), place originals and record likes.
+
+        ``originals`` limits placing originals to those filenames, for updates
+        that know what changed; by default every original is checked.
+        """
+        # Stream into a temporary file and swap it in, so readers never see a half-written page
+        index_path = self.output_dir / 'index.html'
+        tmp_path = self.output_dir / 'index.html.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.writelines(self.render_html(self.live_updates))
+        os.replace(tmp_path, index_path)
         
-        # Write HTML file
-        with open(self.output_dir / 'index.html', 'w') as f:
-            f.write(html)
+        if self.page_shards:
+            self._write_page_shards()
             
-        # Copy original images to output directory
-        for img in self.images:
-            shutil.copy2(
-                self.input_dir / img['filename'],
-                self.output_dir / img['filename']
-            )
+        # Link, clone or copy originals into the output directory, skipping ones already in place
+        mode = self.originals_mode
+        filenames = [img['filename'] for img in self.images] if originals is None else originals
+        for filename in filenames:
+            used = place_original(self.input_dir / filename, self.output_dir / filename, mode)
+            if used != mode:
+                # Same filesystem for every file, so don't retry for the rest
+                print(f"Warning: {mode} is not supported for {self.output_dir}, copying originals instead")
+                mode = used
 
         # Save likes
         self.save_likes()
 
-def create_gallery(input_dir, output_dir, images_per_page=12):
+def create_gallery(input_dir, output_dir, images_per_page=12, workers=1, page_shards=False, layout='grid',
+                   originals_mode='copy', recursive=False, metadata_only=False, lazy_thumbnails=False,
+                   pipeline_threads=None, live_updates=False):
     """
     Create an image gallery from a directory of images.
     
@@ -737,12 +1846,83 @@ def create_gallery(input_dir, output_dir, images_per_page=12):
         input_dir (str): Directory containing source images
         output_dir (str): Directory to output the gallery files
         images_per_page (int): Number of images to display per page
+        workers (int): Number of processes used to create thumbnails
+            (None uses one per CPU)
+        page_shards (bool): Write each page to pages/page-NNNN.json and load
+            it on navigation instead of putting every image in index.html
+        layout (str): 'grid' for Previous/Next pages, 'virtual' to scroll
+            through every image with only the rows in view in the DOM, or
+            'justified' to scroll through uncropped rows laid out at build time
+        originals_mode (str): 'copy', 'hardlink', 'reflink', 'symlink', or
+            'serve-from-source' to leave originals where they are for
+            GalleryServer to serve
+        recursive (bool): Also include images in subdirectories of input_dir
+        metadata_only (bool): Only read dimensions, orientation and capture
+            date from file headers; thumbnails are made by a later build
+            without it (the page shows originals meanwhile)
+        lazy_thumbnails (bool): Like metadata_only, but pages ask
+            GalleryServer to render each thumbnail on first request
+        pipeline_threads (tuple): (readers, encoders, writers) threads to
+            thumbnail with in this process instead of ``workers`` processes
+        live_updates (bool): Have pages reload when GalleryServer pushes an
+            update over /events (a server running next to a GalleryWatcher)
     """
-    gallery = ImageGallery(input_dir, output_dir, images_per_page=images_per_page)
+    gallery = ImageGallery(input_dir, output_dir, images_per_page=images_per_page, workers=workers,
+                           page_shards=page_shards, layout=layout, originals_mode=originals_mode,
+                           recursive=recursive, metadata_only=metadata_only, lazy_thumbnails=lazy_thumbnails,
+                           pipeline_threads=pipeline_threads, live_updates=live_updates)
     gallery.process_images()
     gallery.generate_html()
     print(f"Gallery created successfully in {output_dir}")
+    return gallery
 
-# Example usage
 if __name__ == "__main__":
-    create_gallery("./images", "./gallery_output")
+    parser = argparse.ArgumentParser(description='Create an image gallery from a directory of images')
+    parser.add_argument('input_dir', nargs='?', default='./images',
+                        help='Directory containing source images (default: ./images)')
+    parser.add_argument('output_dir', nargs='?', default='./gallery_output',
+                        help='Directory to output the gallery files (default: ./gallery_output)')
+    parser.add_argument('--images-per-page', type=int, default=12)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes used to create thumbnails, 0 for one per CPU (default: 1)')
+    parser.add_argument('--pipeline', type=int, nargs=3, metavar=('READERS', 'ENCODERS', 'WRITERS'),
+                        help='Thumbnail with reader, encoder and writer threads instead of --workers '
+                             '(0 encoders for one per CPU)')
+    parser.add_argument('--page-shards', action='store_true',
+                        help='Write pages/page-NNNN.json instead of putting every image in index.html')
+    parser.add_argument('--layout', choices=LAYOUTS, default='grid')
+    parser.add_argument('--originals-mode', choices=ORIGINALS_MODES, default='copy')
+    parser.add_argument('--recursive', action='store_true',
+                        help='Also include images in subdirectories of input_dir')
+    parser.add_argument('--metadata-only', action='store_true',
+                        help='Index images from their headers and leave thumbnails for a later build')
+    parser.add_argument('--lazy-thumbnails', action='store_true',
+                        help='Like --metadata-only, but the page has gallery_server.py render thumbnails on demand')
+    parser.add_argument('--watch', action='store_true',
+                        help='Keep running and update the gallery as files are added, changed or removed')
+    parser.add_argument('--debounce', type=float, default=1.0,
+                        help='With --watch, seconds without changes before updating (default: 1.0)')
+    parser.add_argument('--poll-interval', type=float, default=2.0,
+                        help="With --watch and no watchdog installed, seconds between scans (default: 2.0)")
+    parser.add_argument('--serve', action='store_true',
+                        help='With --watch, also serve the gallery and push updates to open pages')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--host', default='0.0.0.0')
+    args = parser.parse_args()
+    
+    # Absolute, since GalleryServer changes the working directory
+    input_dir = Path(args.input_dir).resolve()
+    output_dir = Path(args.output_dir).resolve()
+    gallery = create_gallery(input_dir, output_dir, args.images_per_page, args.workers, args.page_shards,
+                             args.layout, args.originals_mode, args.recursive, args.metadata_only,
+                             args.lazy_thumbnails, args.pipeline, args.watch and args.serve)
+    if args.watch:
+        from gallery_watch import GalleryWatcher
+        if args.serve:
+            from gallery_server import GalleryServer
+            server = GalleryServer(output_dir, args.port, args.host, live_updates=True)
+            watcher = GalleryWatcher(gallery, args.debounce, args.poll_interval, server.notify_update)
+            threading.Thread(target=watcher.run, name='gallery-watch', daemon=True).start()
+            server.run()
+        else:
+            GalleryWatcher(gallery, args.debounce, args.poll_interval).run()
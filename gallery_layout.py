@@ -0,0 +1,69 @@
+import math
+
+# (container width, target row height, gap) in CSS pixels. The page picks the
+# widest entry that fits its gallery and scales it to the exact width, so the
+# widths match the inner width of .gallery.virtual at 360/768/1280/1800px viewports.
+BREAKPOINTS = (
+    (340, 180, 10),
+    (748, 220, 10),
+    (1240, 280, 20),
+    (1760, 300, 20),
+)
+
+# Rows are never squeezed below this fraction of the target height, which
+# bounds how many images a row can hold and keeps the line breaking linear
+MIN_ROW_SCALE = 0.5
+
+
+def justified_rows(aspect_ratios, width, target_height, gap):
+    """Split images into rows that exactly fill ``width``, as close to ``target_height`` as possible.
+
+    Line breaking is a dynamic program over break points (like Knuth-Plass
+    for text): the cost of a row is the squared difference between its
+    justified height and the target, and the sum over all rows is minimised.
+    The last row isn't stretched beyond the target, so a few trailing images
+    don't blow up into a huge row. Returns ``[[count, height], ...]``.
+    """
+    count = len(aspect_ratios)
+    min_height = target_height * MIN_ROW_SCALE
+    best = [0.0] + [math.inf] * count
+    previous = [0] * (count + 1)
+
+    for start in range(count):
+        if best[start] == math.inf:
+            continue
+        ratio_sum = 0.0
+        for end in range(start + 1, count + 1):
+            ratio_sum += aspect_ratios[end - 1]
+            height = (width - gap * (end - start - 1)) / ratio_sum
+            # A lone image always gets a row, however wide it is
+            if height < min_height and end > start + 1:
+                break
+            if end == count and height > target_height:
+                cost = 0.0
+            else:
+                cost = (height - target_height) ** 2
+            if best[start] + cost < best[end]:
+                best[end] = best[start] + cost
+                previous[end] = start
+
+    rows = []
+    end = count
+    while end > 0:
+        start = previous[end]
+        ratio_sum = sum(aspect_ratios[start:end])
+        height = (width - gap * (end - start - 1)) / ratio_sum
+        if end == count:
+            height = min(height, target_height)
+        rows.append([end - start, round(height, 1)])
+        end = start
+    rows.reverse()
+    return rows
+
+
+def justified_layouts(aspect_ratios, breakpoints=BREAKPOINTS):
+    """Row tables for every breakpoint, narrowest first, as shipped to the page."""
+    return [
+        {'width': width, 'gap': gap, 'rows': justified_rows(aspect_ratios, width, target_height, gap)}
+        for width, target_height, gap in breakpoints
+    ]
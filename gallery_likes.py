@@ -0,0 +1,271 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+
+class LikesStore:
+    """Like counts kept in SQLite (WAL mode), safe for concurrent threads and processes.
+
+    Every change is a single transaction, so concurrent likes never overwrite
+    each other and a crash can't leave a half-written file behind. Both
+    ImageGallery and GalleryServer go through this class.
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connect().execute(
+            'CREATE TABLE IF NOT EXISTS likes ('
+            'filename TEXT PRIMARY KEY, count INTEGER NOT NULL DEFAULT 0)'
+        )
+
+    def _connect(self):
+        """One connection per thread, reopened after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_all(self):
+        """Return every count as a {filename: count} dict."""
+        rows = self._connect().execute('SELECT filename, count FROM likes')
+        return dict(rows.fetchall())
+
+    def data_version(self):
+        """Changes whenever another connection commits (see SQLite's PRAGMA data_version)."""
+        return self._connect().execute('PRAGMA data_version').fetchone()[0]
+
+    def get(self, filename):
+        row = self._connect().execute('SELECT count FROM likes WHERE filename = ?', (filename,)).fetchone()
+        return row[0] if row else 0
+
+    def increment(self, filename, delta=1):
+        """Atomically add ``delta`` to one image's count and return the new count."""
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT INTO likes (filename, count) VALUES (?, ?) '
+                'ON CONFLICT(filename) DO UPDATE SET count = count + excluded.count',
+                (filename, delta)
+            )
+            return conn.execute('SELECT count FROM likes WHERE filename = ?', (filename,)).fetchone()[0]
+
+    def add_many(self, deltas):
+        """Atomically apply {filename: delta} and return the new counts of those images."""
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO likes (filename, count) VALUES (?, ?) '
+                'ON CONFLICT(filename) DO UPDATE SET count = count + excluded.count',
+                list(deltas.items())
+            )
+            return {
+                filename: conn.execute('SELECT count FROM likes WHERE filename = ?', (filename,)).fetchone()[0]
+                for filename in deltas
+            }
+
+    def merge(self, likes):
+        """Raise counts to the given absolute values, never lowering them.
+
+        Used for clients that post whole {filename: count} maps, so a stale
+        client can't roll back likes recorded by others.
+        """
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT INTO likes (filename, count) VALUES (?, ?) '
+                'ON CONFLICT(filename) DO UPDATE SET count = MAX(count, excluded.count)',
+                [(filename, int(count)) for filename, count in likes.items()]
+            )
+
+    def ensure(self, filenames):
+        """Create zero counts for images that don't have a row yet."""
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO likes (filename, count) VALUES (?, 0)',
+                [(filename,) for filename in filenames]
+            )
+
+    def import_json(self, json_path):
+        """Seed an empty store from a legacy likes.json; returns True if anything was imported."""
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return False
+        if self._connect().execute('SELECT 1 FROM likes LIMIT 1').fetchone():
+            return False
+        try:
+            with open(json_path, 'r') as f:
+                likes = json.load(f)
+        except (json.JSONDecodeError, IOError) as e:
+            print(f"Warning: Could not import {json_path}: {e}")
+            return False
+        self.merge(likes)
+        return True
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK around a block, for autocommit connections."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+class LikesCache:
+    """In-memory copy of a LikesStore that serves reads and batches writes.
+
+    Reads never touch the database: the serialized JSON body and its ETag are
+    rebuilt only after a change. With ``durability='write-behind'`` likes are
+    applied in memory and flushed to the store as deltas every
+    ``flush_interval`` seconds and on stop(); with ``'write-through'`` every
+    like is committed before it is acknowledged. Deltas (rather than absolute
+    counts) are flushed, so other writers to the same store are never overwritten.
+
+    On the same timer the cache reloads the store when another connection
+    (another server worker, or a gallery rebuild) has committed changes, so
+    each worker process of a multi-process server converges on the same counts.
+    """
+
+    DURABILITY_MODES = ('write-behind', 'write-through')
+
+    def __init__(self, store, flush_interval=1.0, durability='write-behind'):
+        if durability not in self.DURABILITY_MODES:
+            raise ValueError(f"durability must be one of {self.DURABILITY_MODES}, not {durability!r}")
+        self.store = store
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._lock = threading.Lock()
+        self._counts = store.get_all()
+        self._pending = {}
+        self._snapshot = None
+        self._data_version = None
+        self._stop = threading.Event()
+        self._flusher = None
+
+    def start(self):
+        """Start the background flush/sync thread."""
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='likes-flush', daemon=True)
+            self._flusher.start()
+
+    def after_fork(self):
+        """Reset per-process state in a freshly forked server worker.
+
+        Threads don't survive fork() and the lock may have been copied while
+        held, so both are recreated and counts are reloaded from the store.
+        """
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._flusher = None
+        self._pending = {}
+        self._counts = self.store.get_all()
+        self._snapshot = None
+        self._data_version = None
+        self.start()
+
+    def stop(self):
+        """Stop the flush thread and write out anything still pending."""
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                self.sync()
+            except Exception as e:
+                # Keep the deltas in memory and retry on the next tick
+                print(f"Warning: Could not flush likes: {e}")
+
+    def sync(self):
+        """Reload counts if another connection committed to the store since the last sync."""
+        version = self.store.data_version()
+        if version == self._data_version:
+            return
+        counts = self.store.get_all()
+        with self._lock:
+            # Likes not flushed yet still have to show up
+            for filename, delta in self._pending.items():
+                counts[filename] = counts.get(filename, 0) + delta
+            self._counts = counts
+            self._snapshot = None
+        self._data_version = version
+
+    def flush(self):
+        """Apply pending deltas to the store in one transaction."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            stored = self.store.add_many(pending)
+        except BaseException:
+            with self._lock:
+                for filename, delta in pending.items():
+                    self._pending[filename] = self._pending.get(filename, 0) + delta
+            raise
+        with self._lock:
+            # Pick up likes other writers made meanwhile, plus ours that arrived since the swap
+            for filename, count in stored.items():
+                self._counts[filename] = count + self._pending.get(filename, 0)
+            self._snapshot = None
+
+    def get_all(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def get_many(self, filenames):
+        """Counts for just the given images."""
+        with self._lock:
+            return {filename: self._counts.get(filename, 0) for filename in filenames}
+
+    def snapshot(self):
+        """Return the counts as pre-serialized JSON bytes and their ETag."""
+        with self._lock:
+            if self._snapshot is None:
+                body = json.dumps(self._counts).encode()
+                self._snapshot = (body, hashlib.sha1(body).hexdigest())
+            return self._snapshot
+
+    def increment(self, filename, delta=1):
+        """Add ``delta`` to one image's count and return the new count."""
+        if self.durability == 'write-through':
+            count = self.store.increment(filename, delta)
+            with self._lock:
+                self._counts[filename] = count
+                self._snapshot = None
+            return count
+        with self._lock:
+            self._counts[filename] = self._counts.get(filename, 0) + delta
+            self._pending[filename] = self._pending.get(filename, 0) + delta
+            self._snapshot = None
+            return self._counts[filename]
+
+    def merge(self, likes):
+        """Never-lowering merge of absolute counts (see LikesStore.merge), written through."""
+        self.flush()
+        self.store.merge(likes)
+        counts = self.store.get_all()
+        with self._lock:
+            for filename, delta in self._pending.items():
+                counts[filename] = counts.get(filename, 0) + delta
+            self._counts = counts
+            self._snapshot = None
@@ -0,0 +1,221 @@
+import bisect
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derived_files(entry):
+    """Names (inside thumbnails/) of every file generated from one manifest entry."""
+    # Metadata-only entries (needs_assets) have none yet
+    files = {entry['thumbnail']} if entry['thumbnail'] else set()
+    for rendition in entry['renditions']:
+        files.add(rendition['file'])
+        files.update(rendition['formats'].values())
+    return files
+
+
+class GalleryManifest:
+    """Record of every processed source image, kept as manifest.json in the output directory.
+
+    Each entry stores the source's size, mtime and content hash together with
+    the values computed while processing it (dimensions, aspect ratio and
+    thumbnail name), so a rebuild only has to process new or changed files.
+    Entries from a metadata-only build have ``needs_assets`` set and no
+    derived files or hash until a full build processes them.
+    """
+
+    # 2: derived files are named by content hash (see gallery.asset_name)
+    # 3: entries carry a placeholder (see gallery.make_placeholder)
+    # 4: entries carry orientation, capture date and needs_assets (see gallery.read_metadata)
+    VERSION = 4
+
+    def __init__(self, path, settings=None):
+        self.path = Path(path)
+        # Anything that changes the derived files; entries made with other settings are discarded
+        self.settings = settings or {}
+        # Where originals are served from (see gallery_originals); not part of the settings,
+        # since changing it doesn't change any derived file
+        self.originals = None
+        self.entries = {}
+
+    def load(self):
+        """Load entries from disk, starting empty if the manifest is missing, unreadable or stale."""
+        self.entries = {}
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except (json.JSONDecodeError, IOError):
+            return
+        if data.get('version') != self.VERSION or data.get('settings') != self.settings:
+            return
+        self.entries = data.get('entries', {})
+
+    def save(self):
+        """Write the manifest atomically so an interrupted build never leaves it truncated."""
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': self.VERSION,
+                'settings': self.settings,
+                'originals': self.originals,
+                'entries': self.entries,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, filename):
+        return self.entries.get(filename)
+
+    def lookup(self, filename, stat):
+        """Return the entry for a source whose size and mtime are unchanged, else None."""
+        entry = self.entries.get(filename)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            return entry
+        return None
+
+    def update(self, filename, entry):
+        self.entries[filename] = entry
+
+    def remove(self, filename):
+        return self.entries.pop(filename, None)
+
+    def prune(self, filenames, unscanned=()):
+        """Drop entries whose source is no longer present and return them.
+
+        Entries whose name starts with one of the ``unscanned`` prefixes (directories
+        the scan couldn't list) are kept, since their absence proves nothing.
+        """
+        keep = set(filenames)
+        unscanned = tuple(unscanned)
+        removed = [name for name in self.entries
+                   if name not in keep and not (unscanned and name.startswith(unscanned))]
+        return [self.entries.pop(name) for name in removed]
+
+    def needing_assets(self):
+        """Names of entries still waiting for their thumbnails, sorted."""
+        return sorted(name for name, entry in self.entries.items() if entry['needs_assets'])
+
+
+class ManifestIndex:
+    """Read-only, sorted view of a manifest.json for paging through a gallery.
+
+    The manifest is re-read only when its mtime changes, so a rebuild shows up
+    without restarting whoever holds the index.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._mtime_ns = None
+        self._filenames = []
+        self._entries = {}
+        self._etags = {}
+        self._source_dir = None
+        self._settings = {}
+
+    def _refresh(self):
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return
+            data = {}
+            if mtime_ns is not None:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+            entries = data.get('entries', {})
+            originals = data.get('originals') or {}
+            if originals.get('mode') == 'serve-from-source':
+                self._source_dir = Path(originals['source_dir'])
+            else:
+                self._source_dir = None
+            self._settings = data.get('settings') or {}
+            self._entries = entries
+            self._filenames = sorted(entries)
+            self._etags = self._build_etags(entries)
+            self._mtime_ns = mtime_ns
+
+    @staticmethod
+    def _build_etags(entries):
+        """Strong ETags for every original and derived file, from the stored content hashes.
+
+        Derived files are named by source hash and encoding parameters, so the
+        name itself identifies their bytes; nothing is hashed per request.
+        """
+        etags = {}
+        for entry in entries.values():
+            if entry['sha256']:
+                etags[entry['filename']] = entry['sha256']
+            for name in derived_files(entry):
+                etags[f"thumbnails/{name}"] = name
+        return etags
+
+    def etag(self, path):
+        """Strong ETag for a gallery-relative path, or None if the manifest doesn't know it."""
+        self._refresh()
+        with self._lock:
+            return self._etags.get(path)
+
+    def source_dir(self, path):
+        """Directory to serve an original from when the build left it in the source directory, else None."""
+        self._refresh()
+        with self._lock:
+            if self._source_dir is not None and path in self._entries:
+                return self._source_dir
+            return None
+
+    def settings(self):
+        """The build settings (see ImageGallery.thumbnail_options), {} without a manifest."""
+        self._refresh()
+        with self._lock:
+            return self._settings
+
+    def source_path(self, filename):
+        """Where the original of an indexed image is, or None for images the manifest doesn't know."""
+        self._refresh()
+        with self._lock:
+            if filename not in self._entries:
+                return None
+            return (self._source_dir or self.path.parent) / filename
+
+    def page(self, after=None, limit=50):
+        """Return up to ``limit`` entries sorted by filename, starting after ``after``.
+
+        Paging by the last filename seen (rather than by offset) keeps pages
+        stable while images are added or removed.
+        """
+        self._refresh()
+        with self._lock:
+            start = bisect.bisect_right(self._filenames, after) if after is not None else 0
+            names = self._filenames[start:start + limit]
+            has_more = start + limit < len(self._filenames)
+            return [self._entries[name] for name in names], has_more
+
+    def get(self, filename):
+        self._refresh()
+        with self._lock:
+            return self._entries.get(filename)
+
+    def exists(self):
+        """Whether there is a manifest.json at all (galleries built before it have none)."""
+        self._refresh()
+        with self._lock:
+            return self._mtime_ns is not None
+
+    def __len__(self):
+        self._refresh()
+        return len(self._filenames)
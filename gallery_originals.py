@@ -0,0 +1,110 @@
+import errno
+import os
+import shutil
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # Not a POSIX system: reflinks fall back to copies
+    fcntl = None
+
+# How originals get into the output directory:
+#   copy               independent copy (the old behaviour)
+#   hardlink           same inode, no extra space; needs the same filesystem
+#   reflink            copy-on-write clone (Btrfs, XFS, ...), no extra space until either side changes
+#   symlink            link to the source file
+#   serve-from-source  nothing in the output directory; GalleryServer serves the source directory
+ORIGINALS_MODES = ('copy', 'hardlink', 'reflink', 'symlink', 'serve-from-source')
+
+# Linux ioctl that clones one file's extents into another (_IOW(0x94, 9, int))
+FICLONE = 0x40049409
+
+# Errors meaning "this filesystem or platform can't do that", as opposed to real I/O failures
+UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EINVAL, errno.ENOTTY, errno.ENOSYS,
+}
+
+
+def reflink(src, dst):
+    """Clone ``src`` to ``dst`` with FICLONE, raising OSError where unsupported."""
+    if fcntl is None:
+        raise OSError(errno.ENOTSUP, "reflinks need fcntl.ioctl", str(src))
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        try:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+        except OSError:
+            dst_file.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _copy(src, dst):
+    shutil.copy2(src, dst)
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def _symlink(src, dst):
+    os.symlink(Path(src).resolve(), dst)
+
+
+PLACERS = {
+    'copy': _copy,
+    'hardlink': _hardlink,
+    'reflink': reflink,
+    'symlink': _symlink,
+}
+
+
+def is_placed(src, dst, mode):
+    """Whether ``dst`` already is what ``mode`` would make of ``src``."""
+    if mode == 'symlink':
+        return dst.is_symlink() and Path(os.readlink(dst)) == Path(src).resolve()
+    if not dst.exists() or dst.is_symlink():
+        return False
+    src_stat, dst_stat = src.stat(), dst.stat()
+    if mode == 'hardlink':
+        return os.path.samestat(src_stat, dst_stat)
+    if os.path.samestat(src_stat, dst_stat):
+        # A hard link left by an earlier build isn't an independent copy
+        return False
+    # copy2 and reflink preserve mtime, so an identical copy matches on size and mtime
+    return (src_stat.st_size, src_stat.st_mtime_ns) == (dst_stat.st_size, dst_stat.st_mtime_ns)
+
+
+def place_original(src, dst, mode):
+    """Put ``src`` at ``dst`` using ``mode``, falling back to a copy where that's unsupported.
+
+    The new file is made under a temporary name and swapped in, so a server
+    never sees a missing or partial original. Returns the mode actually used.
+    """
+    src, dst = Path(src), Path(dst)
+    # Building into the input directory: dst is the source itself (the last component
+    # isn't resolved, so a symlink or leftover at dst still gets replaced)
+    if src.resolve() == dst.parent.resolve() / dst.name:
+        return mode
+    if mode == 'serve-from-source':
+        # Leftovers from an earlier mode would only take up space
+        if dst.exists() or dst.is_symlink():
+            dst.unlink()
+        return mode
+    if is_placed(src, dst, mode):
+        return mode
+    # Images from subdirectories of the input keep their relative path
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = dst.with_name(f"{dst.name}.{os.getpid()}.tmp")
+    try:
+        PLACERS[mode](src, tmp_path)
+    except OSError as e:
+        if mode == 'copy' or e.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        if tmp_path.exists() or tmp_path.is_symlink():
+            tmp_path.unlink()
+        mode = 'copy'
+        _copy(src, tmp_path)
+    os.replace(tmp_path, dst)
+    return mode
@@ -0,0 +1,173 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from io import BytesIO
+
+from gallery import encode_thumbnail, process_image
+
+# Tasks each queue holds between two stages; bounds how many sources (and
+# encoded thumbnails) are in memory at once
+PIPELINE_QUEUE_SIZE = 8
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage, summed over its threads."""
+
+    def __init__(self, name, threads):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.bytes = 0
+        # Seconds spent working, as opposed to waiting on the neighbouring queues
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, size=0):
+        with self._lock:
+            self.items += 1
+            self.bytes += size
+            self.busy += seconds
+
+    def summary(self, wall):
+        """One line: items and MB per second of wall time, and how busy the threads were.
+
+        The stage whose threads are busiest is the bottleneck: readers or
+        writers near 100% mean disk-bound, encoders near 100% mean CPU-bound.
+        """
+        utilisation = self.busy / (wall * self.threads) if wall else 0.0
+        return (f"{self.name:<7} {self.threads:>2} threads  {self.items / wall if wall else 0:>7.1f} images/s  "
+                f"{self.bytes / wall / 1e6 if wall else 0:>7.1f} MB/s  {utilisation:>4.0%} busy")
+
+
+class ThumbnailPipeline:
+    """Thumbnail a stream of sources with reader, encoder and writer threads.
+
+    Readers load each source file into memory and hash it, encoders run
+    process_image on those bytes and keep the encoded files in memory, and
+    writers put the files in place. The stages are connected by bounded
+    queues, so a slow stage holds the others back instead of piling up
+    sources. Pillow and hashlib release the GIL while decoding, resizing,
+    encoding and hashing, so the threads overlap for real; this suits hosts
+    where a pool of processes (ImageGallery's ``workers``) is too heavy, or
+    where the disk rather than the CPU is the limit.
+    """
+
+    def __init__(self, readers=2, encoders=None, writers=2, queue_size=PIPELINE_QUEUE_SIZE):
+        self.concurrency = {
+            'read': readers,
+            'encode': encoders or os.cpu_count() or 1,
+            'write': writers,
+        }
+        if min(self.concurrency.values()) < 1:
+            raise ValueError(f"every stage needs at least one thread, got {self.concurrency}")
+        self.queue_size = queue_size
+        self.stats = {}
+        self.wall = 0.0
+
+    def run(self, tasks, thumbs_dir, options):
+        """Process ``(name, img_path, stat)`` tasks; yield ``(name, img_path, stat, (image, error))``.
+
+        Results come back in completion order, in the calling thread, which
+        is also the only one that consumes ``tasks``. Like _process_image_task,
+        a failing source yields an error string rather than raising.
+        """
+        self.stats = {stage: StageStats(stage, threads) for stage, threads in self.concurrency.items()}
+        read_queue = queue.Queue(self.queue_size)
+        encode_queue = queue.Queue(self.queue_size)
+        write_queue = queue.Queue(self.queue_size)
+        # Unbounded, so writers never wait on the caller
+        results = queue.Queue()
+        stop = object()
+
+        def read():
+            stats = self.stats['read']
+            for task in iter(read_queue.get, stop):
+                start = time.perf_counter()
+                try:
+                    with open(task[1], 'rb') as f:
+                        data = f.read()
+                    digest = hashlib.sha256(data).hexdigest()
+                except OSError as e:
+                    results.put((*task, (None, str(e))))
+                    continue
+                stats.record(time.perf_counter() - start, len(data))
+                encode_queue.put((task, data, digest))
+
+        def encode():
+            stats = self.stats['encode']
+            for task, data, digest in iter(encode_queue.get, stop):
+                start = time.perf_counter()
+                files = []
+
+                def save(thumb, path, fmt=None, quality=None):
+                    buffer = BytesIO()
+                    encode_thumbnail(thumb, buffer, path.suffix, fmt, quality)
+                    files.append((path, buffer.getvalue()))
+
+                try:
+                    image = process_image(task[1], thumbs_dir, **options, source=BytesIO(data), digest=digest,
+                                          save=save)
+                except Exception as e:
+                    results.put((*task, (None, str(e))))
+                    continue
+                # Bytes encoded, so the MB/s column compares with the writers'
+                stats.record(time.perf_counter() - start, sum(len(data) for _, data in files))
+                write_queue.put((task, image, files))
+
+        def write():
+            stats = self.stats['write']
+            for task, image, files in iter(write_queue.get, stop):
+                start = time.perf_counter()
+                try:
+                    for path, data in files:
+                        # Same temporary name scheme as save_thumbnail, so readers never see a partial file
+                        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+                        with open(tmp_path, 'wb') as f:
+                            f.write(data)
+                        os.replace(tmp_path, path)
+                except OSError as e:
+                    results.put((*task, (None, str(e))))
+                    continue
+                stats.record(time.perf_counter() - start, sum(len(data) for _, data in files))
+                results.put((*task, (image, None)))
+
+        stages = [(read, read_queue), (encode, encode_queue), (write, write_queue)]
+        threads = []
+        for (target, stage_queue), threads_per_stage in zip(stages, self.concurrency.values()):
+            for i in range(threads_per_stage):
+                thread = threading.Thread(target=target, name=f"gallery-{target.__name__}-{i}", daemon=True)
+                thread.start()
+                threads.append((thread, stage_queue))
+
+        start = time.perf_counter()
+        submitted = finished = 0
+        try:
+            for task in tasks:
+                read_queue.put(task)
+                submitted += 1
+                # Hand back whatever is done while the rest are still being fed in
+                while True:
+                    try:
+                        result = results.get_nowait()
+                    except queue.Empty:
+                        break
+                    finished += 1
+                    yield result
+            while finished < submitted:
+                finished += 1
+                yield results.get()
+        finally:
+            self.wall = time.perf_counter() - start
+            # With every result handed back the stages are idle, so the threads can be stopped;
+            # a caller that gave up early leaves them (daemons) to the interpreter
+            if finished == submitted:
+                for thread, stage_queue in threads:
+                    stage_queue.put(stop)
+                for thread, _ in threads:
+                    thread.join()
+
+    def summary(self):
+        """Per-stage throughput lines for the last run."""
+        return [stats.summary(self.wall) for stats in self.stats.values()]
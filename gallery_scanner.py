@@ -0,0 +1,104 @@
+import os
+import queue
+import threading
+from pathlib import Path
+
+# Items a background scan may run ahead of whoever consumes it
+SCAN_QUEUE_SIZE = 1024
+
+
+def scan_images(root, extensions, recursive=False, exclude=(), failed=None):
+    """Yield ``(name, path, stat)`` for every image file under ``root``.
+
+    ``name`` is the path relative to ``root`` with '/' separators, which is
+    how images are identified in the manifest and URLs. One os.scandir pass
+    per directory: files are filtered by extension on the name alone, and
+    each file is stat'ed once, with the DirEntry's result handed on so
+    nothing downstream has to stat it again (on Windows that stat is free,
+    on network filesystems it saves a round trip per Path call).
+
+    Hidden entries are skipped, symlinked directories aren't followed (no
+    cycles), and directories in ``exclude`` (e.g. an output directory inside
+    the input) are left out. Order is unspecified; callers sort.
+
+    A ``root`` that can't be listed raises OSError, since an empty result
+    would look like every image was deleted. Subdirectories that can't be
+    listed are reported and skipped; their name prefixes (e.g. 'trips/2019/')
+    are appended to ``failed`` so callers know what the scan didn't see.
+    """
+    extensions = {ext.lower() for ext in extensions}
+    excluded = {os.path.realpath(path) for path in exclude}
+    directories = [(os.fspath(root), '')]
+    while directories:
+        directory, prefix = directories.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() in extensions:
+                        try:
+                            if entry.is_file():
+                                yield prefix + entry.name, Path(entry.path), entry.stat()
+                        except OSError:
+                            # Deleted (or a dangling symlink) between listing and stat
+                            continue
+                    elif recursive and entry.is_dir(follow_symlinks=False):
+                        if excluded and os.path.realpath(entry.path) in excluded:
+                            continue
+                        directories.append((entry.path, f"{prefix}{entry.name}/"))
+        except OSError as e:
+            if not prefix:
+                raise
+            print(f"Warning: Could not scan {directory}: {e}")
+            if failed is not None:
+                failed.append(prefix)
+
+
+def relative_name(path, root):
+    """The scan_images name of ``path`` under ``root``, or None if it lies outside."""
+    relative = os.path.relpath(os.path.abspath(path), os.path.abspath(root))
+    if relative == os.curdir or relative.startswith(os.pardir + os.sep) or relative == os.pardir:
+        return None
+    return Path(relative).as_posix()
+
+
+def prefetch(iterable, maxsize=SCAN_QUEUE_SIZE):
+    """Iterate ``iterable`` in a background thread, handing items over through a bounded queue.
+
+    Lets a slow producer (a directory walk over a network mount) keep going
+    while the consumer works on what it has, without ever holding more than
+    ``maxsize`` items. Exceptions in the producer are re-raised in the consumer.
+    """
+    items = queue.Queue(maxsize)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        items.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+
+    producer = threading.Thread(target=produce, name='gallery-scan', daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        # The consumer stopped early: let the producer exit instead of blocking on put()
+        stop.set()
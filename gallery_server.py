@@ -1,49 +1,284 @@
-from flask import Flask, send_from_directory, request
+from flask import Flask, send_from_directory, request, abort, Response
+from werkzeug.utils import safe_join
 import webbrowser
 import argparse
 import socket
 from pathlib import Path
 import os
+import mimetypes
+import atexit
+import base64
+import hashlib
 import json
+import queue
+import threading
+from gallery import IMAGE_EXTENSIONS
+from gallery_likes import LikesStore, LikesCache
+from gallery_manifest import ManifestIndex
+from gallery_thumbcache import DEFAULT_MAX_BYTES, ThumbnailCache
+
+# Page size limits for /api/images
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 500
+
+# Cache lifetimes (seconds). index.html, page shards and /likes change with
+# every rebuild or like, so browsers only keep them briefly; originals carry
+# strong ETags from the manifest, so revalidating them is a 304. Thumbnails
+# are named by content and never change, so they are cached for a year.
+PAGE_MAX_AGE = 60
+LIKES_MAX_AGE = 5
+ASSET_MAX_AGE = 24 * 60 * 60
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Seconds between comments on an idle /events stream, so proxies don't time it out
+EVENTS_KEEPALIVE = 15
+
+# Older Pythons don't know the modern thumbnail formats; Flask would serve them as octet-stream
+mimetypes.add_type('image/avif', '.avif')
+mimetypes.add_type('image/webp', '.webp')
+
+
+def encode_cursor(filename):
+    """Opaque /api/images cursor for "everything after this filename"."""
+    return base64.urlsafe_b64encode(filename.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        # validate=True: urlsafe_b64decode would silently drop stray characters
+        return base64.b64decode(cursor + '=' * (-len(cursor) % 4), altchars=b'-_', validate=True).decode()
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"invalid cursor: {cursor!r}")
 
 
 class GalleryServer:
-    def __init__(self, gallery_dir="./gallery_output", port=8000, host='0.0.0.0'):
-        self.gallery_dir = Path(gallery_dir)
+    def __init__(self, gallery_dir="./gallery_output", port=8000, host='0.0.0.0',
+                 flush_interval=1.0, durability='write-behind', workers=1, threads=1, open_browser=True,
+                 thumb_cache_dir=None, thumb_cache_bytes=DEFAULT_MAX_BYTES, live_updates=False):
+        # Absolute, since run() changes into the gallery directory
+        self.gallery_dir = Path(gallery_dir).resolve()
         self.port = port
         self.host = host
-        self.likes_file = Path(os.getcwd()) / 'gallery_output' / 'likes.json'
+        # Above 1, run() uses a production WSGI server instead of Flask's development one
+        self.workers = workers
+        self.threads = threads
+        self.open_browser = open_browser
+        self.likes_store = LikesStore(self.gallery_dir / 'likes.db')
+        self.likes_store.import_json(self.gallery_dir / 'likes.json')
+        # Likes are served from memory and written back per `durability`
+        self.likes = LikesCache(self.likes_store, flush_interval, durability)
+        self.likes.start()
+        atexit.register(self.likes.stop)
+        # Image listing for /api/images, reloaded whenever a build rewrites manifest.json
+        self.index = ManifestIndex(self.gallery_dir / 'manifest.json')
+        # Thumbnails for /thumb/<size>/<filename>, rendered on first request (lazy_thumbnails galleries)
+        self.thumb_cache_dir = Path(thumb_cache_dir).resolve() if thumb_cache_dir else self.gallery_dir / 'thumb-cache'
+        self.thumb_cache_bytes = thumb_cache_bytes
+        self._thumb_cache = None
+        self._thumb_cache_lock = threading.Lock()
+        # /events streams never end, so they are only offered next to a GalleryWatcher
+        # (python gallery.py --watch --serve), and never with a fixed pool of workers
+        self.live_updates = live_updates
+        if live_updates and (workers > 1 or threads > 1):
+            raise ValueError("live_updates needs the development server; it can't run with workers or threads")
+        # One queue per open /events stream, fed by notify_update
+        self._listeners = set()
+        self._listeners_lock = threading.Lock()
         self.app = Flask(__name__)
         
         # Configure route
         @self.app.route('/<path:path>')
         def serve_files(path):
-            return send_from_directory(self.gallery_dir, path)
+            return self.send_cached(path)
             
         @self.app.route('/')
         def serve_root():
-            return send_from_directory(self.gallery_dir, 'index.html')
+            return self.send_cached('index.html')
         
         @self.app.get('/likes')
         def get_likes():
-            with self.likes_file.open("r") as f:
-                print(json.load(f))
-            with self.likes_file.open("r") as f:
-                return json.load(f)
+            # ?files=a.jpg&files=b.jpg returns just those counts (one page's worth);
+            # repeated parameters rather than a joined list, since names may contain commas
+            filenames = request.args.getlist('files')
+            if filenames:
+                if len(filenames) > MAX_PAGE_LIMIT:
+                    abort(400, f"at most {MAX_PAGE_LIMIT} files per request")
+                body = json.dumps(self.likes.get_many(filenames)).encode()
+                etag = hashlib.sha1(body).hexdigest()
+            else:
+                body, etag = self.likes.snapshot()
+            response = Response(body, mimetype='application/json')
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = LIKES_MAX_AGE
+            return response.make_conditional(request)
+        
+        @self.app.get('/api/images')
+        def list_images():
+            # Not type=int, which would quietly fall back to the default for ?limit=abc
+            try:
+                limit = int(request.args.get('limit', DEFAULT_PAGE_LIMIT))
+            except ValueError:
+                limit = None
+            if limit is None or not 1 <= limit <= MAX_PAGE_LIMIT:
+                abort(400, f"limit must be between 1 and {MAX_PAGE_LIMIT}")
+            cursor = request.args.get('cursor')
+            try:
+                after = decode_cursor(cursor) if cursor else None
+            except ValueError:
+                abort(400, "invalid cursor")
+            
+            entries, has_more = self.index.page(after, limit)
+            counts = self.likes.get_many(entry['filename'] for entry in entries)
+            body = json.dumps({
+                'images': [{
+                    'filename': entry['filename'],
+                    'thumbnail': entry['thumbnail'],
+                    'width': entry['width'],
+                    'height': entry['height'],
+                    'aspect_ratio': entry['aspect_ratio'],
+                    'likes': counts[entry['filename']],
+                } for entry in entries],
+                'next_cursor': encode_cursor(entries[-1]['filename']) if has_more else None,
+            }).encode()
+            
+            response = Response(body, mimetype='application/json')
+            response.set_etag(hashlib.sha1(body).hexdigest())
+            response.cache_control.public = True
+            response.cache_control.max_age = PAGE_MAX_AGE
+            return response.make_conditional(request)
+        
+        @self.app.get('/thumb/<int:size>/<path:filename>')
+        def lazy_thumbnail(filename, size):
+            # Only indexed images, and only the sizes the build would have made, so
+            # clients can't fill the cache with arbitrary renders
+            source = self.index.source_path(filename)
+            if source is None or size not in self.thumbnail_sizes():
+                abort(404)
+            entry = self.index.get(filename)
+            key = entry['sha256'] or f"{filename}\0{entry['size']}\0{entry['mtime_ns']}"
+            try:
+                name = self.thumb_cache.get(source, size, key)
+            except (OSError, ValueError) as e:
+                print(f"Error rendering {filename} at {size}px: {e}")
+                abort(404)
+            # The URL stays the same when the source changes, so revalidate instead of immutable
+            return send_from_directory(self.thumb_cache.cache_dir, name, etag=name, max_age=ASSET_MAX_AGE)
+        
+        @self.app.post('/likes/<path:filename>/increment')
+        def increment_like(filename):
+            # One row update, independent of gallery size
+            if not self._is_known_image(filename):
+                abort(404)
+            return {'filename': filename, 'likes': self.likes.increment(filename)}
+        
+        def events():
+            # Server-sent events: pages reload themselves when a watching build updates the gallery
+            listener = queue.Queue(maxsize=16)
+            with self._listeners_lock:
+                self._listeners.add(listener)
+            
+            def stream():
+                try:
+                    while True:
+                        try:
+                            data = listener.get(timeout=EVENTS_KEEPALIVE)
+                        except queue.Empty:
+                            yield ': keepalive\n\n'
+                            continue
+                        yield f"event: gallery-update\ndata: {data}\n\n"
+                finally:
+                    with self._listeners_lock:
+                        self._listeners.discard(listener)
+            
+            return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+        
+        if live_updates:
+            self.app.get('/events')(events)
         
         @self.app.post('/save-likes')
         def save_likes():
-            with self.likes_file.open("r") as f:
-                likes = json.load(f)
+            # Compatibility shim for pages generated before /likes/<filename>/increment.
+            # Clients post their whole map; counts only ever go up, so merge with MAX
+            # in one transaction instead of letting the last writer win
+            incoming = request.get_json(silent=True)
+            if not isinstance(incoming, dict) or not all(
+                    isinstance(count, int) and not isinstance(count, bool) and count >= 0
+                    for count in incoming.values()):
+                abort(400, "expected a JSON object of filename: non-negative integer count")
+            # Old pages may still list deleted images; those, and anything else, are dropped
+            self.likes.merge({filename: count for filename, count in incoming.items()
+                              if self._is_known_image(filename)})
+            return {}
 
-            incoming = request.get_json()
+    def _is_known_image(self, filename):
+        """Whether ``filename`` is an image of this gallery, and so may have likes.
 
-            for key, value in incoming.items():
-                likes[key] = value
+        The manifest knows every image, including originals that were never
+        copied into the gallery, so only galleries built without one fall
+        back to the image files on disk.
+        """
+        if self.index.get(filename) is not None:
+            return True
+        if self.index.exists() or Path(filename).suffix.lower() not in IMAGE_EXTENSIONS:
+            return False
+        image_path = safe_join(str(self.gallery_dir), filename)
+        return image_path is not None and os.path.isfile(image_path)
 
-            with self.likes_file.open("w") as f:
-                json.dump(likes, f)
-            return {}
+    def notify_update(self, update):
+        """Push a gallery update (any JSON-able summary) to every open /events stream.
+
+        Only reaches clients of this process, so it is meant for a server
+        running next to a GalleryWatcher (python gallery.py --watch --serve).
+        """
+        data = json.dumps(update)
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener.put_nowait(data)
+            except queue.Full:
+                # A stalled client still has updates queued; it reloads on those
+                pass
+
+    @property
+    def thumb_cache(self):
+        """The ThumbnailCache, created (and its directory scanned) on first use."""
+        with self._thumb_cache_lock:
+            if self._thumb_cache is None:
+                quality = self.index.settings().get('quality')
+                self._thumb_cache = ThumbnailCache(self.thumb_cache_dir, self.thumb_cache_bytes, quality)
+            return self._thumb_cache
+
+    def thumbnail_sizes(self):
+        """Box sizes /thumb renders: the build's rendition ladder and grid thumbnail size."""
+        settings = self.index.settings()
+        sizes = set(settings.get('renditions', ()))
+        if settings.get('thumb_size'):
+            sizes.add(max(settings['thumb_size']))
+        return sizes
+
+    def send_cached(self, path):
+        """Send a gallery file with validators and a Cache-Control matching what it is.
+
+        Originals and thumbnails get the strong ETag recorded in the manifest
+        (no hashing per request), and thumbnails, being content-addressed, are
+        marked immutable; anything else falls back to Flask's mtime/size based
+        ETag. If-None-Match and If-Modified-Since are answered with 304 either way.
+        """
+        etag = self.index.etag(path)
+        immutable = etag is not None and path.startswith('thumbnails/')
+        if immutable:
+            max_age = IMMUTABLE_MAX_AGE
+        elif etag is not None:
+            max_age = ASSET_MAX_AGE
+        else:
+            max_age = PAGE_MAX_AGE
+        # Galleries built with originals_mode='serve-from-source' have no copy of the originals
+        directory = self.index.source_dir(path) or self.gallery_dir
+        response = send_from_directory(directory, path, etag=etag or True, max_age=max_age)
+        response.cache_control.immutable = immutable
+        return response
 
     def get_ip_addresses(self):
         """Get all network interfaces IP addresses."""
@@ -91,19 +326,64 @@ class GalleryServer:
         print("\n⚡ Server Details:")
         print(f"   • Host: {self.host}")
         print(f"   • Port: {self.port}")
+        if self.workers > 1 or self.threads > 1:
+            print(f"   • Workers: {self.workers} x {self.threads} threads")
         print("\n⌨️  Press Ctrl+C to stop the server")
         print("="*50 + "\n")
         
         # Open browser automatically
-        webbrowser.open(f'http://localhost:{self.port}')
+        if self.open_browser:
+            webbrowser.open(f'http://localhost:{self.port}')
         
         try:
             # Start server
-            self.app.run(host=self.host, port=self.port)
+            if self.workers > 1 or self.threads > 1:
+                self.serve_production()
+            else:
+                self.app.run(host=self.host, port=self.port)
         except KeyboardInterrupt:
             print("\n🛑 Shutting down server...")
             print("👋 Server stopped")
             print("="*50 + "\n")
+        finally:
+            # Don't lose likes still waiting for the next write-behind flush
+            self.likes.stop()
+
+    def serve_production(self):
+        """Serve with gunicorn (workers x threads), or waitress (threads only) without it.
+
+        Worker processes share likes through the SQLite store; each worker's
+        cache is reset after fork and flushed when the worker exits.
+        """
+        try:
+            from gunicorn.app.base import BaseApplication
+        except ImportError:
+            BaseApplication = None
+        
+        if BaseApplication is not None:
+            server = self
+            
+            class GalleryApplication(BaseApplication):
+                def load_config(self):
+                    self.cfg.set('bind', f'{server.host}:{server.port}')
+                    self.cfg.set('workers', server.workers)
+                    self.cfg.set('threads', server.threads)
+                    self.cfg.set('post_fork', lambda arbiter, worker: server.likes.after_fork())
+                    self.cfg.set('worker_exit', lambda arbiter, worker: server.likes.stop())
+                
+                def load(self):
+                    return server.app
+            
+            GalleryApplication().run()
+            return
+        
+        if self.workers > 1:
+            raise SystemExit("Error: --workers needs gunicorn (pip install gunicorn)")
+        try:
+            import waitress
+        except ImportError:
+            raise SystemExit("Error: --threads needs gunicorn or waitress (pip install gunicorn)")
+        waitress.serve(self.app, host=self.host, port=self.port, threads=self.threads)
 
 if __name__ == "__main__":
     # Parse command line arguments
@@ -114,9 +394,26 @@ if __name__ == "__main__":
                       help='Port to run the server on (default: 8000)')
     parser.add_argument('--host', default='0.0.0.0',
                       help='Host address to bind to (default: 0.0.0.0 - all interfaces)')
+    parser.add_argument('--flush-interval', type=float, default=1.0,
+                      help='Seconds between writes of cached likes to disk (default: 1.0)')
+    parser.add_argument('--durability', choices=LikesCache.DURABILITY_MODES, default='write-behind',
+                      help='write-behind batches likes in memory; write-through commits each one '
+                           '(default: write-behind)')
+    parser.add_argument('--workers', type=int, default=1,
+                      help='Worker processes; above 1 serves with gunicorn (default: 1)')
+    parser.add_argument('--threads', type=int, default=1,
+                      help='Threads per worker; above 1 serves with gunicorn or waitress (default: 1)')
+    parser.add_argument('--no-browser', action='store_true',
+                      help="Don't open a browser on start")
+    parser.add_argument('--thumb-cache', default=None,
+                      help='Directory for thumbnails rendered on demand (default: <dir>/thumb-cache)')
+    parser.add_argument('--thumb-cache-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                      help='Disk budget for thumbnails rendered on demand, in MB (default: %(default)s)')
     
     args = parser.parse_args()
     
     # Start server
-    server = GalleryServer(args.dir, args.port, args.host)
+    server = GalleryServer(args.dir, args.port, args.host, args.flush_interval, args.durability,
+                           args.workers, args.threads, not args.no_browser, args.thumb_cache,
+                           args.thumb_cache_mb * 1024 * 1024)
     server.run()
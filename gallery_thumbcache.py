@@ -0,0 +1,132 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+
+from PIL import Image
+
+from gallery import make_thumbnail, save_thumbnail, thumbnail_dimensions
+
+# Default disk budget for lazily rendered thumbnails
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+
+class ThumbnailCache:
+    """Thumbnails rendered on first request and kept on disk up to ``max_bytes``.
+
+    Rendering is the build's own (thumbnail_dimensions, make_thumbnail and
+    save_thumbnail), so a lazily rendered thumbnail looks like a pre-rendered
+    one. When the cache grows past ``max_bytes`` the least recently used
+    files are deleted. Concurrent requests for the same thumbnail wait for
+    one render instead of each decoding the original.
+
+    Recency is kept in memory and seeded from file mtimes at startup (hits
+    touch the file). Worker processes each track the cache on their own, so
+    with several of them the budget is approximate; a file another worker
+    evicted is simply rendered again.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, quality=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        # Per-format encoder quality overrides, as for ImageGallery
+        self.quality = quality
+        self._lock = threading.Lock()
+        # name -> size in bytes, least recently used first
+        self._files = OrderedDict()
+        self._bytes = 0
+        # name -> Future of a render in progress
+        self._pending = {}
+        self._load()
+
+    def _load(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith('.tmp'):
+                    # Left behind by a render that was interrupted
+                    os.unlink(entry.path)
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime_ns, entry.name, stat.st_size))
+        for _, name, size in sorted(files):
+            self._files[name] = size
+            self._bytes += size
+
+    @staticmethod
+    def cache_name(source, size, key):
+        """File name for ``source`` at ``size``; ``key`` changes whenever the source does."""
+        digest = hashlib.sha1(f"{key}\0{size}".encode()).hexdigest()[:20]
+        return f"{digest}_{size}{Path(source).suffix.lower()}"
+
+    def get(self, source, size, key):
+        """Name (inside cache_dir) of ``source`` fitted into a ``size`` x ``size`` box.
+
+        Renders it if it isn't cached yet; errors from decoding ``source`` are raised.
+        """
+        name = self.cache_name(source, size, key)
+        path = self.cache_dir / name
+        with self._lock:
+            cached = name in self._files
+            if cached:
+                self._files.move_to_end(name)
+        if cached:
+            try:
+                os.utime(path)
+                return name
+            except FileNotFoundError:
+                # Evicted by another worker process
+                self._forget(name)
+
+        with self._lock:
+            future = self._pending.get(name)
+            rendering = future is None
+            if rendering:
+                future = self._pending[name] = Future()
+        if not rendering:
+            return future.result()
+
+        try:
+            self._render(source, size, path)
+            self._add(name, path.stat().st_size)
+            future.set_result(name)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._pending[name]
+        return name
+
+    def _render(self, source, size, path):
+        with Image.open(source) as img:
+            dims = thumbnail_dimensions(img.width, img.height, (size, size))
+            # Never upscale; the original is the largest there is
+            if dims[0] > img.width:
+                dims = img.size
+            save_thumbnail(make_thumbnail(img, *dims), path, quality=self.quality)
+
+    def _add(self, name, size):
+        evicted = []
+        with self._lock:
+            self._bytes += size - self._files.pop(name, 0)
+            self._files[name] = size
+            # The new file stays even if it alone is over budget
+            while self._bytes > self.max_bytes and len(self._files) > 1:
+                old_name, old_size = self._files.popitem(last=False)
+                self._bytes -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.unlink(self.cache_dir / old_name)
+            except FileNotFoundError:
+                pass
+
+    def _forget(self, name):
+        with self._lock:
+            self._bytes -= self._files.pop(name, 0)
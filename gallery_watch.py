@@ -0,0 +1,127 @@
+import threading
+import time
+from pathlib import Path
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    # Optional; without it the input directory is polled
+    Observer = None
+
+
+class GalleryWatcher:
+    """Keep an ImageGallery up to date while files in its input directory change.
+
+    Uses inotify (or the platform's equivalent) through watchdog when it is
+    installed, and otherwise polls the directory, comparing size and mtime.
+    Changes are collected until none has arrived for ``debounce`` seconds, so
+    a burst of copies (or a file still being written) becomes one update.
+    ``on_update({'updated': [...], 'removed': [...]})`` is called after each
+    update, e.g. GalleryServer.notify_update to push it to open pages.
+    """
+
+    def __init__(self, gallery, debounce=1.0, poll_interval=2.0, on_update=None, use_watchdog=True):
+        self.gallery = gallery
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.on_update = on_update
+        self.use_watchdog = use_watchdog and Observer is not None
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._last_change = None
+        self._stop = threading.Event()
+
+    def add_changes(self, paths):
+        with self._lock:
+            self._changed.update(Path(path) for path in paths)
+            self._last_change = time.monotonic()
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """Watch until stop() is called (or Ctrl+C)."""
+        method = 'watchdog' if self.use_watchdog else f'polling every {self.poll_interval}s'
+        print(f"Watching {self.gallery.input_dir} for changes ({method})")
+        observer = None
+        # A poll only notices a file still growing at the next poll, so wait at least that long
+        settle = self.debounce if self.use_watchdog else max(self.debounce, self.poll_interval)
+        if self.use_watchdog:
+            observer = Observer()
+            observer.schedule(_ChangeHandler(self), str(self.gallery.input_dir),
+                              recursive=self.gallery.recursive)
+            observer.start()
+        else:
+            snapshot = self._snapshot()
+            next_poll = time.monotonic() + self.poll_interval
+        try:
+            while not self._stop.wait(min(self.debounce, self.poll_interval) / 4):
+                if observer is None and time.monotonic() >= next_poll:
+                    current = self._snapshot(snapshot)
+                    changed = {name for name in snapshot.keys() | current.keys()
+                               if snapshot.get(name) != current.get(name)}
+                    if changed:
+                        self.add_changes(self.gallery.input_dir / name for name in changed)
+                    snapshot = current
+                    next_poll = time.monotonic() + self.poll_interval
+                self._apply_if_settled(settle)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+    def _snapshot(self, previous=None):
+        """{name: (size, mtime_ns)} of the source images, one scandir pass per directory.
+
+        Whatever couldn't be listed keeps its ``previous`` state, so an
+        unreadable directory isn't mistaken for deleted images.
+        """
+        failed = []
+        try:
+            current = {name: (stat.st_size, stat.st_mtime_ns) for name, _, stat in self.gallery.scan(failed)}
+        except OSError as e:
+            if previous is None:
+                raise
+            print(f"Warning: Could not scan {self.gallery.input_dir}: {e}")
+            return previous
+        if previous and failed:
+            prefixes = tuple(failed)
+            current.update((name, state) for name, state in previous.items() if name.startswith(prefixes))
+        return current
+
+    def _apply_if_settled(self, settle):
+        with self._lock:
+            if not self._changed or time.monotonic() - self._last_change < settle:
+                return
+            changed, self._changed = self._changed, set()
+        try:
+            updated, removed = self.gallery.update(changed)
+        except Exception as e:
+            # Keep watching; the files are looked at again when they next change
+            print(f"Error updating gallery: {e}")
+            return
+        if updated or removed:
+            print(f"Updated {len(updated)} and removed {len(removed)} images")
+            if self.on_update is not None:
+                self.on_update({'updated': updated, 'removed': removed})
+
+
+# Event types that can mean new content; reads (our own included) are ignored
+CHANGE_EVENTS = {'created', 'modified', 'moved', 'deleted', 'closed'}
+
+if Observer is not None:
+    class _ChangeHandler(FileSystemEventHandler):
+        def __init__(self, watcher):
+            self.watcher = watcher
+
+        def on_any_event(self, event):
+            if event.is_directory or event.event_type not in CHANGE_EVENTS:
+                return
+            paths = [event.src_path]
+            # Moves and renames report both ends
+            if getattr(event, 'dest_path', None):
+                paths.append(event.dest_path)
+            self.watcher.add_changes(paths)